@@ -0,0 +1,22 @@
+from django.contrib import admin
+
+from .models import RequestProfile
+
+
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = (
+        'endpoint', 'method', 'status_code', 'duration', 'memory_peak',
+        'created'
+    )
+    list_filter = ('endpoint', 'method', 'status_code')
+    search_fields = ('path',)
+    readonly_fields = (
+        'endpoint', 'method', 'path', 'status_code', 'duration',
+        'memory_peak', 'stats_file', 'functions', 'allocations', 'created'
+    )
+
+    def has_add_permission(self, request):
+        return False
+
+
+admin.site.register(RequestProfile, RequestProfileAdmin)
@@ -0,0 +1,129 @@
+import heapq
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.db.models import Count
+
+from recipes.models import Ingredient, IngredientAmount
+from recipes.versions import get_versions
+
+
+def fold(text):
+    return text.casefold().replace('ё', 'е')
+
+
+class IngredientIndex:
+    """Индекс названий ингредиентов в памяти процесса.
+
+    Названия хранятся отсортированными, поэтому префикс ищется бинарным
+    поиском. Версии 'ingredients' (названия) и 'ingredient_usage'
+    (составы рецептов) проверяет фоновый поток раз в
+    INGREDIENT_INDEX_REFRESH_INTERVAL секунд: при смене первой индекс
+    строится заново, при смене второй перечитываются только веса.
+    Запрос поиска в базу не ходит; без фонового потока (runserver,
+    тесты) версии проверяет сам запрос, но не чаще того же интервала.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.versions = None
+        self.checked_at = 0
+        self.refresher = None
+        # Ключи, строки ответа и веса заменяются одним присваиванием,
+        # чтобы поиск не видел их из разных сборок.
+        self.state = ([], [], [])
+
+    def load_usage(self, items):
+        usage = dict(
+            IngredientAmount.objects.values_list('ingredients').order_by()
+            .annotate(total=Count('pk'))
+        )
+        return [usage.get(item['id'], 0) for item in items]
+
+    def build(self):
+        rows = sorted(
+            (fold(name), pk, name, unit)
+            for pk, name, unit in Ingredient.objects.values_list(
+                'pk', 'name', 'measurement_unit')
+        )
+        items = [
+            {'id': pk, 'name': name, 'measurement_unit': unit}
+            for _, pk, name, unit in rows
+        ]
+        return [row[0] for row in rows], items, self.load_usage(items)
+
+    def refresh(self):
+        with self.lock:
+            versions = get_versions('ingredients', 'ingredient_usage')
+            if self.versions is None or versions[0] != self.versions[0]:
+                self.state = self.build()
+            elif versions[1] != self.versions[1]:
+                keys, items, _ = self.state
+                self.state = keys, items, self.load_usage(items)
+            self.versions = versions
+            self.checked_at = time.monotonic()
+
+    def ensure_current(self):
+        if self.versions is None:
+            self.refresh()
+            return
+        age = time.monotonic() - self.checked_at
+        if (
+            self.refresher is None
+            and age > settings.INGREDIENT_INDEX_REFRESH_INTERVAL
+            and not self.lock.locked()
+        ):
+            self.refresh()
+
+    def run_refresher(self):
+        while True:
+            time.sleep(settings.INGREDIENT_INDEX_REFRESH_INTERVAL)
+            try:
+                connection.close_if_unusable_or_obsolete()
+                self.refresh()
+            except DatabaseError:
+                pass
+
+    def warm_up(self):
+        """Строит индекс и запускает фоновое обновление воркера."""
+        try:
+            self.refresh()
+        except DatabaseError:
+            pass
+        if self.refresher is None:
+            self.refresher = threading.Thread(
+                target=self.run_refresher, daemon=True)
+            self.refresher.start()
+
+    def best(self, usage, positions, limit):
+        return heapq.nsmallest(
+            limit, positions,
+            key=lambda position: (-usage[position], position)
+        )
+
+    def search(self, query, limit=None):
+        """Сначала совпадения по началу названия, затем по подстроке.
+
+        Внутри каждой группы чаще используемые ингредиенты идут первыми.
+        """
+        self.ensure_current()
+        limit = limit or settings.INGREDIENT_AUTOCOMPLETE_LIMIT
+        query = fold(query)
+        keys, items, usage = self.state
+        start = bisect_left(keys, query)
+        end = bisect_left(keys, query + '\U0010ffff', start)
+        found = self.best(usage, range(start, end), limit)
+        if len(found) < limit:
+            found += self.best(
+                usage,
+                (position for position, key in enumerate(keys)
+                 if query in key and not key.startswith(query)),
+                limit - len(found)
+            )
+        return [items[position] for position in found]
+
+
+ingredient_index = IngredientIndex()
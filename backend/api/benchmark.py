@@ -0,0 +1,174 @@
+import math
+import re
+import time
+import tracemalloc
+
+from django.db import connection
+from django.db.models import Count
+from django.urls import URLResolver
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import User
+from . import urls
+from .metrics import make_wrapper
+
+GROUP = re.compile(r'\(\?P<(\w+)>[^)]*\)')
+PERCENTILES = (50, 95, 99)
+
+
+def walk(patterns, prefix=''):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from walk(
+                pattern.url_patterns, prefix + str(pattern.pattern))
+        else:
+            yield prefix + str(pattern.pattern), pattern.name, pattern.callback
+
+
+def get_routes():
+    """Маршруты api/urls.py: (имя, шаблон пути, методы) без дублей.
+
+    Варианты с суффиксом формата пропускаются, а из совпадающих путей
+    (роутеры проекта и djoser) остаётся первый - тот, что и отвечает.
+    """
+    seen = set()
+    for regex, name, callback in walk(urls.urlpatterns):
+        if 'format' in regex:
+            continue
+        path = '/api/' + regex.replace('^', '').replace('$', '').replace(
+            '/?', '/')
+        if GROUP.sub('*', path) in seen:
+            continue
+        seen.add(GROUP.sub('*', path))
+        actions = getattr(callback, 'actions', None)
+        if actions is None:
+            methods = {
+                method for method in ('get', 'post', 'put', 'patch', 'delete')
+                if hasattr(callback.cls, method)
+            }
+        else:
+            methods = set(actions) - {'head', 'options'}
+        yield name, path, methods
+
+
+def percentile(values, percent):
+    """Перцентиль по ближайшему рангу."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+class Benchmark:
+    """Прогоняет маршруты API тестовым клиентом Django.
+
+    GET-маршруты запрашиваются как есть, пары POST/DELETE (избранное,
+    корзина, подписки) - по очереди над объектом, с которым у
+    пользователя ещё нет связи, чтобы данные не менялись. Остальные
+    методы (создание, изменение, удаление, djoser) попадают в skipped.
+    """
+
+    def __init__(self, iterations, anonymous=False):
+        self.iterations = iterations
+        self.user = User.objects.annotate(
+            follows=Count('follower')).order_by('-follows', 'pk').first()
+        self.client = APIClient()
+        if not anonymous:
+            self.client.force_authenticate(self.user)
+        free_recipe = Recipe.objects.exclude(
+            favorites__user=self.user).exclude(
+            shopping_list__user=self.user).order_by('-pk').first()
+        free_author = User.objects.exclude(pk=self.user.pk).exclude(
+            following__user=self.user).order_by('-pk').first()
+        self.detail_ids = {
+            'users': (free_author or self.user).pk,
+            'recipes': Recipe.objects.order_by('-favorites_count').first().pk,
+            'tags': Tag.objects.first().pk,
+            'ingredients': Ingredient.objects.first().pk,
+        }
+        self.toggle_ids = {
+            resource: target.pk for resource, target in (
+                ('users', free_author), ('recipes', free_recipe))
+            if target is not None
+        }
+
+    def make_path(self, path, ids):
+        resource = path.split('/')[2]
+        return GROUP.sub(lambda match: str(ids[resource]), path)
+
+    def request(self, method, path, data=None):
+        response = getattr(self.client, method)(path, data, format='json')
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+    def prepare(self, method, path, data):
+        """Перед DELETE связь создаётся, после POST - удаляется."""
+        if method == 'delete':
+            self.request('post', path, data)
+
+    def cleanup(self, method, path, data):
+        if method == 'post':
+            self.request('delete', path, data)
+
+    def measure(self, method, path, data=None):
+        durations = []
+        queries = []
+        for iteration in range(self.iterations + 1):
+            self.prepare(method, path, data)
+            state = {'queries': 0, 'db': 0}
+            with connection.execute_wrapper(make_wrapper(state)):
+                started = time.perf_counter()
+                response = self.request(method, path, data)
+                duration = time.perf_counter() - started
+            self.cleanup(method, path, data)
+            # Первый запрос прогревает кеши и индексы и не учитывается.
+            if iteration:
+                durations.append(duration)
+                queries.append(state['queries'])
+        self.prepare(method, path, data)
+        tracemalloc.start()
+        self.request(method, path, data)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        self.cleanup(method, path, data)
+        result = {
+            'method': method.upper(),
+            'path': path,
+            'status': response.status_code,
+        }
+        for percent in PERCENTILES:
+            result[f'p{percent}_ms'] = round(
+                percentile(durations, percent) * 1000, 2)
+        result['queries'] = max(queries)
+        result['peak_memory_kb'] = round(peak / 1024, 1)
+        return result
+
+    def cases(self):
+        """(имя, метод, путь, тело); путь None - метод не измеряется."""
+        for name, path, methods in get_routes():
+            resource = path.split('/')[2]
+            if 'get' in methods:
+                yield name, 'get', self.make_path(path, self.detail_ids), None
+                skipped = methods - {'get'}
+            elif {'post', 'delete'} <= methods and resource in self.toggle_ids:
+                data = None if GROUP.search(path) else {
+                    'ids': [self.toggle_ids[resource]]}
+                path = self.make_path(path, self.toggle_ids)
+                yield name, 'post', path, data
+                yield name, 'delete', path, data
+                skipped = methods - {'post', 'delete'}
+            else:
+                skipped = methods
+            for method in sorted(skipped):
+                yield name, method, None, None
+
+    def run(self):
+        results = []
+        skipped = []
+        for name, method, path, data in self.cases():
+            if path is None:
+                skipped.append({'name': name, 'method': method.upper()})
+            else:
+                results.append(
+                    {'name': name, **self.measure(method, path, data)})
+        return results, skipped
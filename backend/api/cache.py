@@ -0,0 +1,60 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+
+from recipes.versions import get_versions
+
+RESPONSE_KEY = 'response:{}'
+STATS_KEY = 'response-cache:{}'
+
+
+def count_event(event):
+    key = STATS_KEY.format(event)
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def get_cache_stats():
+    keys = {event: STATS_KEY.format(event) for event in ('hit', 'miss')}
+    values = cache.get_many(keys.values())
+    return {event: values.get(key, 0) for event, key in keys.items()}
+
+
+def get_cache_key(request, scopes):
+    params = sorted(
+        (key, sorted(request.query_params.getlist(key)))
+        for key in request.query_params
+    )
+    raw = json.dumps([
+        request.get_host(),
+        request.path,
+        params,
+        get_versions(*scopes)
+    ])
+    return RESPONSE_KEY.format(hashlib.md5(raw.encode()).hexdigest())
+
+
+def cached_response(request, scopes, get_response):
+    """Отдаёт закешированный ответ для анонимного пользователя.
+
+    Ключ включает версии областей scopes, поэтому после изменения
+    данных старые ответы просто перестают находиться в кеше.
+    """
+    if not request.user.is_anonymous:
+        return get_response()
+    key = get_cache_key(request, scopes)
+    data = cache.get(key)
+    if data is not None:
+        count_event('hit')
+        return Response(data)
+    count_event('miss')
+    response = get_response()
+    if response.status_code == 200:
+        cache.set(key, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+    return response
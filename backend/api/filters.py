@@ -1,6 +1,12 @@
 from django_filters.rest_framework import FilterSet, filters
+from rest_framework.filters import BaseFilterBackend, OrderingFilter
 
 from recipes.models import Ingredient, Recipe, Tag
+from recipes.search import search_recipes
+
+ANY_TAG = 'any'
+ALL_TAGS = 'all'
+TAGS_MODES = ((ANY_TAG, 'Любой из тегов'), (ALL_TAGS, 'Все теги'))
 
 
 class RecipeFilter(FilterSet):
@@ -11,7 +17,20 @@ class RecipeFilter(FilterSet):
     tags = filters.ModelMultipleChoiceFilter(
         field_name='tags__slug',
         to_field_name='slug',
-        queryset=Tag.objects.all()
+        queryset=Tag.objects.all(),
+        method='filter_tags'
+    )
+    tags_mode = filters.ChoiceFilter(
+        choices=TAGS_MODES,
+        method='filter_tags_mode'
+    )
+    min_cooking_time = filters.NumberFilter(
+        field_name='cooking_time',
+        lookup_expr='gte'
+    )
+    max_cooking_time = filters.NumberFilter(
+        field_name='cooking_time',
+        lookup_expr='lte'
     )
     is_favorited = filters.BooleanFilter(
         method='get_is_favorited'
@@ -22,7 +41,21 @@ class RecipeFilter(FilterSet):
 
     class Meta:
         model = Recipe
-        fields = ['author', 'tags', 'is_favorited', 'is_in_shopping_cart']
+        fields = ['author', 'tags', 'tags_mode', 'min_cooking_time',
+                  'max_cooking_time', 'is_favorited', 'is_in_shopping_cart']
+
+    def filter_tags(self, queryset, name, tags):
+        """Любой из тегов, с tags_mode=all - все теги сразу."""
+        if not tags:
+            return queryset
+        if self.form.cleaned_data.get('tags_mode') == ALL_TAGS:
+            for tag in tags:
+                queryset = queryset.filter(tags=tag)
+            return queryset
+        return queryset.filter(tags__in=tags).distinct()
+
+    def filter_tags_mode(self, queryset, name, value):
+        return queryset
 
     def get_is_favorited(self, queryset, value, name):
         user = self.request.user
@@ -43,3 +76,32 @@ class IngredientFilter(FilterSet):
     class Meta:
         model = Ingredient
         fields = ['name']
+
+
+class RecipeOrderingFilter(OrderingFilter):
+    """Сортировка рецептов с устойчивым порядком при равных значениях."""
+
+    def get_ordering(self, request, queryset, view):
+        ordering = list(super().get_ordering(request, queryset, view))
+        if (
+            'search_rank' in queryset.query.annotations
+            and not request.query_params.get(self.ordering_param)
+        ):
+            ordering.insert(0, '-search_rank')
+        for field in view.ordering:
+            if field.lstrip('-') not in {
+                item.lstrip('-') for item in ordering
+            }:
+                ordering.append(field)
+        return ordering
+
+
+class RecipeSearchFilter(BaseFilterBackend):
+    """Полнотекстовый поиск по названию, описанию и ингредиентам."""
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+        return search_recipes(queryset, query)
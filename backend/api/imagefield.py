@@ -1,20 +1,119 @@
 import base64
+import binascii
 from uuid import uuid4
 
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.files.base import ContentFile, File
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from PIL import Image
 from rest_framework import serializers
 
+from recipes.renditions import get_paths
+
+EXTENSIONS = {
+    'JPEG': 'jpg',
+    'PNG': 'png',
+    'GIF': 'gif',
+    'WEBP': 'webp',
+    'BMP': 'bmp',
+    'TIFF': 'tif',
+}
+DECODE_CHUNK = 64 * 1024
+
+
+def decode_base64(imgstr):
+    """Декодирует base64 кусками во временный файл.
+
+    Небольшие картинки остаются в памяти, крупные пишутся на диск,
+    как это делает Django для загрузок из multipart/form-data.
+    """
+    if len(imgstr) * 3 // 4 <= settings.FILE_UPLOAD_MAX_MEMORY_SIZE:
+        return ContentFile(base64.b64decode(imgstr), name='image')
+    upload = TemporaryUploadedFile('image', None, 0, None)
+    for start in range(0, len(imgstr), DECODE_CHUNK):
+        upload.write(base64.b64decode(imgstr[start:start + DECODE_CHUNK]))
+    upload.size = upload.tell()
+    upload.seek(0)
+    return upload
+
+
+def get_extension(file):
+    """Расширение по формату из заголовка файла: Pillow читает только его."""
+    try:
+        image_format = Image.open(file).format or ''
+    except (OSError, ValueError):
+        raise serializers.ValidationError(
+            'Загрузите корректное изображение'
+        )
+    finally:
+        file.seek(0)
+    return EXTENSIONS.get(image_format, image_format.lower())
+
 
 class ImageConversion(serializers.ImageField):
+    """Картинка из base64-строки или из файла multipart/form-data.
+
+    Размер проверяется до декодирования, имя файла - uuid4 с расширением
+    по формату, который определил Pillow по заголовку. Сама картинка
+    в запросе не декодируется.
+    """
+
     def to_internal_value(self, data):
-        try:
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            id = uuid4()
-            data = ContentFile(
-                base64.b64decode(imgstr), name=str(id) + '.' + ext)
-        except:
+        max_size = settings.RECIPE_IMAGE_MAX_SIZE
+        if isinstance(data, str):
+            try:
+                _, imgstr = data.split(';base64,')
+            except ValueError:
+                raise serializers.ValidationError(
+                    'Картинка должна быть кодирована в base64'
+                )
+            if len(imgstr) * 3 // 4 > max_size:
+                raise serializers.ValidationError(
+                    f'Размер картинки не должен превышать {max_size} байт'
+                )
+            try:
+                data = decode_base64(imgstr)
+            except (binascii.Error, ValueError):
+                raise serializers.ValidationError(
+                    'Картинка должна быть кодирована в base64'
+                )
+        elif not isinstance(data, File):
             raise serializers.ValidationError(
                 'Картинка должна быть кодирована в base64'
             )
-        return super().to_internal_value(data)
+        elif data.size > max_size:
+            raise serializers.ValidationError(
+                f'Размер картинки не должен превышать {max_size} байт'
+            )
+        data.name = f'{uuid4()}.{get_extension(data)}'
+        # Проверка Pillow в ImageField декодирует картинку целиком,
+        # здесь достаточно заголовка: полностью её читает фоновая задача
+        # построения копий.
+        return serializers.FileField.to_internal_value(self, data)
+
+
+class RenditionsField(serializers.Field):
+    """Ссылки на уменьшенные копии картинки рецепта.
+
+    Пока копии не построены, отдаётся null и клиент берёт image.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        if not recipe.image_hash:
+            return None
+        request = self.context.get('request')
+        renditions = {}
+        for name, formats in get_paths(recipe.image_hash).items():
+            renditions[name] = {}
+            for image_format, path in formats.items():
+                url = default_storage.url(path)
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                renditions[name][image_format] = url
+        return renditions
@@ -0,0 +1,102 @@
+import json
+import os
+import platform
+
+import django
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from api.benchmark import Benchmark
+from recipes.models import Recipe
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет все маршруты api/urls.py тестовым клиентом на нескольких '
+        'объёмах данных и выводит p50/p95/p99, число SQL-запросов и пик '
+        'памяти в JSON. Недостающие рецепты досоздаёт generate_load_data, '
+        'поэтому запускать только на отдельной базе.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', default='1000,10000',
+            help='Число рецептов для каждого прогона через запятую')
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--anonymous', action='store_true',
+                            help='Запросы без авторизации (через кеш)')
+        parser.add_argument('--no-generate', action='store_true',
+                            help='Один прогон на имеющихся данных')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Файл для JSON')
+
+    def get_sizes(self, options):
+        if options['no_generate']:
+            return [None]
+        try:
+            return sorted(int(size) for size in options['sizes'].split(','))
+        except ValueError:
+            raise CommandError('--sizes: числа через запятую')
+
+    def fill(self, size, seed):
+        missing = size - Recipe.objects.count()
+        if missing > 0:
+            self.stderr.write(f'Создаются рецепты: {missing}')
+            call_command(
+                'generate_load_data',
+                recipes=missing,
+                users=max(10, missing // 10),
+                ingredients=max(50, missing // 5),
+                tags=5,
+                seed=seed,
+                stdout=open(os.devnull, 'w')
+            )
+
+    def handle(self, *args, **options):
+        # Тестовый клиент обращается к хосту testserver.
+        with override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']
+        ):
+            report = self.run(options)
+        data = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(data)
+        else:
+            self.stdout.write(data)
+
+    def run(self, options):
+        report = {
+            'created': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'iterations': options['iterations'],
+            'anonymous': options['anonymous'],
+            'runs': [],
+        }
+        for size in self.get_sizes(options):
+            if size is not None:
+                self.fill(size, options['seed'])
+            if not Recipe.objects.exists():
+                raise CommandError(
+                    'Нет рецептов: запустите generate_load_data')
+            results, skipped = Benchmark(
+                options['iterations'], options['anonymous']).run()
+            for result in results:
+                self.stderr.write(
+                    '{recipes:>7} {name:<32} {method:<6} {p50_ms:>8} мс '
+                    '{queries:>3} запросов'.format(
+                        recipes=Recipe.objects.count(), **result))
+            report['runs'].append({
+                'recipes': Recipe.objects.count(),
+                'users': User.objects.count(),
+                'results': results,
+                'skipped': skipped,
+            })
+        return report
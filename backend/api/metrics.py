@@ -0,0 +1,339 @@
+import json
+import os
+import socket
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework.serializers import BaseSerializer
+
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+QUERY_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+# Фазы запроса, время которых копится суммой.
+PHASES = ('db', 'serializer', 'app', 'render')
+
+# Состояние запроса, который сейчас обрабатывает поток: сериализатору
+# оно не передаётся, а время его data нужно отнести к запросу.
+active = threading.local()
+
+
+def get_endpoint(view_func, method):
+    """Имя обработчика: basename и действие viewset (recipes-list).
+
+    У дополнительных действий берётся url_path, как в адресе
+    (recipes-download_shopping_cart), у остальных вьюх - имя функции.
+    """
+    actions = getattr(view_func, 'actions', None)
+    if not actions:
+        return getattr(view_func, '__name__', 'unknown')
+    action = actions.get(method.lower(), method.lower())
+    handler = getattr(view_func.cls, action, None)
+    action = getattr(handler, 'url_path', action)
+    return f'{view_func.initkwargs.get("basename")}-{action}'
+
+
+def new_histogram(buckets):
+    return {'buckets': [0] * (len(buckets) + 1), 'sum': 0}
+
+
+def new_stats():
+    return {
+        'duration': new_histogram(DURATION_BUCKETS),
+        'queries': new_histogram(QUERY_BUCKETS),
+        **{phase: 0 for phase in PHASES}
+    }
+
+
+def observe(histogram, buckets, value):
+    position = len(buckets)
+    for index, bound in enumerate(buckets):
+        if value <= bound:
+            position = index
+            break
+    histogram['buckets'][position] += 1
+    histogram['sum'] += value
+
+
+class Metrics:
+    """Гистограммы запросов одного процесса.
+
+    Запросы складываются в память под блокировкой, а не чаще раза
+    в METRICS_FLUSH_INTERVAL секунд процесс перезаписывает свой файл
+    в METRICS_DIR. Эндпоинт метрик суммирует файлы всех процессов,
+    так что данные gunicorn-воркеров сходятся в одном ответе.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.flushed_at = time.monotonic()
+        self.name = None
+
+    def record(self, endpoint, method, status_code, timings, queries):
+        key = (endpoint, method, f'{status_code // 100}xx')
+        with self.lock:
+            stats = self.stats.get(key)
+            if stats is None:
+                stats = self.stats[key] = new_stats()
+            observe(stats['duration'], DURATION_BUCKETS, timings['total'])
+            observe(stats['queries'], QUERY_BUCKETS, queries)
+            for phase in PHASES:
+                stats[phase] += timings[phase]
+        interval = time.monotonic() - self.flushed_at
+        if interval > settings.METRICS_FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            self.flushed_at = time.monotonic()
+            rows = [
+                {'endpoint': endpoint, 'method': method, 'status': status,
+                 **stats}
+                for (endpoint, method, status), stats in self.stats.items()
+            ]
+            data = json.dumps(rows)
+        if self.name is None:
+            # Время старта в имени не даёт новому процессу с тем же pid
+            # затереть накопленное старым.
+            self.name = (
+                f'{socket.gethostname()}-{os.getpid()}-{int(time.time())}'
+            )
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        path = os.path.join(settings.METRICS_DIR, f'{self.name}.json')
+        with open(f'{path}.tmp', 'w') as file:
+            file.write(data)
+        os.replace(f'{path}.tmp', path)
+
+
+metrics = Metrics()
+
+
+def is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def is_stale(path, name):
+    """Файл умершего процесса этой машины или давно не обновлявшийся.
+
+    Живой процесс без запросов свой файл не обновляет; если файл
+    удалён по METRICS_FILE_TTL, процесс запишет его заново целиком
+    при следующем сбросе.
+    """
+    host, pid, _ = name[:-len('.json')].rsplit('-', 2)
+    if host == socket.gethostname() and pid.isdigit():
+        if not is_alive(int(pid)):
+            return True
+    return time.time() - os.path.getmtime(path) > settings.METRICS_FILE_TTL
+
+
+def read_files(directory):
+    """Строки статистики из файлов живых процессов.
+
+    Устаревшие файлы удаляются, чтобы запросы процессов, которых уже
+    нет, не попадали в гистограммы.
+    """
+    if not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        if not name.endswith('.json') or name.count('-') < 2:
+            continue
+        path = os.path.join(directory, name)
+        try:
+            if is_stale(path, name):
+                os.remove(path)
+                continue
+            with open(path) as file:
+                rows = json.load(file)
+        except (OSError, ValueError):
+            continue
+        yield from rows
+
+
+def merge_files(directory):
+    """Сумма статистики из файлов всех процессов."""
+    merged = {}
+    for row in read_files(directory):
+        key = (row.pop('endpoint'), row.pop('method'), row.pop('status'))
+        stats = merged.get(key)
+        if stats is None:
+            stats = merged[key] = new_stats()
+        for field in ('duration', 'queries'):
+            stats[field]['sum'] += row[field]['sum']
+            stats[field]['buckets'] = [
+                total + value for total, value in zip(
+                    stats[field]['buckets'], row[field]['buckets'])
+            ]
+        # В файлах процессов прошлых версий может не быть новых фаз.
+        for phase in PHASES:
+            stats[phase] += row.get(phase, 0)
+    return merged
+
+
+def format_labels(key, **extra):
+    endpoint, method, status = key
+    labels = {'endpoint': endpoint, 'method': method, 'status': status,
+              **extra}
+    return ','.join(
+        '{}="{}"'.format(
+            name, str(value).replace('\\', r'\\').replace('"', r'\"'))
+        for name, value in labels.items()
+    )
+
+
+def format_histogram(name, help_text, buckets, merged, field):
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+    for key, stats in sorted(merged.items()):
+        histogram = stats[field]
+        total = 0
+        for bound, value in zip(
+            list(buckets) + ['+Inf'], histogram['buckets']
+        ):
+            total += value
+            lines.append(
+                f'{name}_bucket{{{format_labels(key, le=bound)}}} {total}')
+        lines.append(f'{name}_sum{{{format_labels(key)}}} {histogram["sum"]}')
+        lines.append(f'{name}_count{{{format_labels(key)}}} {total}')
+    return lines
+
+
+def render_prometheus():
+    """Метрики всех процессов в текстовом формате Prometheus."""
+    metrics.flush()
+    merged = merge_files(settings.METRICS_DIR)
+    lines = format_histogram(
+        'foodgram_request_duration_seconds', 'Время обработки запроса.',
+        DURATION_BUCKETS, merged, 'duration'
+    )
+    lines += format_histogram(
+        'foodgram_request_queries', 'Число SQL-запросов на запрос.',
+        QUERY_BUCKETS, merged, 'queries'
+    )
+    for phase, help_text in (
+        ('db', 'Суммарное время SQL-запросов.'),
+        ('serializer', 'Время сериализации ответа без SQL.'),
+        ('app', 'Время вьюхи без SQL и сериализации.'),
+        ('render', 'Время рендеринга ответа.'),
+    ):
+        name = f'foodgram_request_{phase}_seconds_total'
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+        lines += [
+            f'{name}{{{format_labels(key)}}} {stats[phase]}'
+            for key, stats in sorted(merged.items())
+        ]
+    return '\n'.join(lines) + '\n'
+
+
+def make_wrapper(state):
+    """execute_wrapper, считающий запросы и их время в state."""
+    def wrapper(execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            state['queries'] += 1
+            state['db'] += time.perf_counter() - started
+    return wrapper
+
+
+def timed_data(data):
+    """Свойство data сериализатора, которое копит своё время в запросе.
+
+    Учитывается только внешний сериализатор: вложенные поля вызывают
+    to_representation, а не data. SQL, выполненный при сериализации,
+    остаётся в фазе db.
+    """
+    def get_data(serializer):
+        state = getattr(active, 'state', None)
+        if state is None or state['serializing']:
+            return data.fget(serializer)
+        state['serializing'] = True
+        started = time.perf_counter()
+        db_started = state['db']
+        try:
+            return data.fget(serializer)
+        finally:
+            state['serializing'] = False
+            state['serializer'] += (
+                time.perf_counter() - started - (state['db'] - db_started))
+    get_data.timed = True
+    return property(get_data)
+
+
+class MetricsMiddleware:
+    """Считает SQL-запросы и время фаз каждого запроса.
+
+    Фазы отдаются заголовком Server-Timing и копятся в metrics
+    по имени обработчика. SQL учитывается через execute_wrapper
+    всех подключений, пока запрос проходит через middleware, поэтому
+    запросы потоковых ответов после отдачи заголовков не считаются.
+    У DRF нет точки расширения вокруг сериализации, поэтому время
+    data считает обёртка свойства BaseSerializer.data.
+    """
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if not getattr(BaseSerializer.data.fget, 'timed', False):
+            BaseSerializer.data = timed_data(BaseSerializer.data)
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        state = request._metrics = {
+            'endpoint': 'unmatched', 'queries': 0, 'db': 0,
+            'serializer': 0, 'serializing': False,
+            'view_started': None, 'view_finished': None
+        }
+        active.state = state
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(
+                        make_wrapper(state)))
+                response = self.get_response(request)
+        finally:
+            active.state = None
+        finished = time.perf_counter()
+        view_started = state['view_started'] or finished
+        view_finished = state['view_finished'] or finished
+        timings = {
+            'total': finished - started,
+            'db': state['db'],
+            'serializer': state['serializer'],
+            'app': max(
+                view_finished - view_started - state['db']
+                - state['serializer'], 0),
+            'render': finished - view_finished,
+        }
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={timings["db"] * 1000:.1f};'
+            f'desc="{state["queries"]} queries"',
+            f'serializer;dur={timings["serializer"] * 1000:.1f}',
+            f'app;dur={timings["app"] * 1000:.1f}',
+            f'render;dur={timings["render"] * 1000:.1f}',
+            f'total;dur={timings["total"] * 1000:.1f}',
+        ])
+        metrics.record(
+            state['endpoint'], request.method, response.status_code,
+            timings, state['queries']
+        )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._metrics['endpoint'] = get_endpoint(view_func, request.method)
+        request._metrics['view_started'] = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        request._metrics['view_finished'] = time.perf_counter()
+        return response
@@ -0,0 +1,35 @@
+# Generated by Django 2.2.19 on 2026-10-18 02:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestProfile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('endpoint', models.CharField(db_index=True, max_length=200, verbose_name='Обработчик')),
+                ('method', models.CharField(max_length=10, verbose_name='Метод')),
+                ('path', models.TextField(verbose_name='Адрес')),
+                ('status_code', models.IntegerField(verbose_name='Код ответа')),
+                ('duration', models.FloatField(verbose_name='Время, мс')),
+                ('memory_peak', models.BigIntegerField(help_text='По данным tracemalloc за время запроса', verbose_name='Пик памяти, байт')),
+                ('stats_file', models.CharField(help_text='Открывается pstats, snakeviz или flameprof', max_length=500, verbose_name='Файл pstats')),
+                ('functions', models.TextField(help_text='Самые долгие по суммарному времени', verbose_name='Функции')),
+                ('allocations', models.TextField(help_text='Строки кода, выделившие больше всего памяти', verbose_name='Выделения памяти')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Снят')),
+            ],
+            options={
+                'verbose_name': 'Профиль запроса',
+                'verbose_name_plural': 'Профили запросов',
+                'ordering': ['-created'],
+            },
+        ),
+    ]
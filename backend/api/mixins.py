@@ -1,5 +1,12 @@
+import hashlib
+from functools import partial
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
 from rest_framework import mixins, viewsets
 
+from recipes.versions import get_versions
+
 
 class ListRetrieveViewSet(
     mixins.ListModelMixin,
@@ -7,3 +14,48 @@ class ListRetrieveViewSet(
     viewsets.GenericViewSet
 ):
     pass
+
+
+def make_validators(*parts, modified=0):
+    """ETag и Last-Modified из версий данных (меток времени в мс)."""
+    raw = ':'.join(str(part) for part in parts)
+    etag = quote_etag(hashlib.md5(raw.encode()).hexdigest())
+    return etag, int(modified // 1000)
+
+
+class ConditionalGetMixin:
+    """Отвечает 304 до сериализации, если данные не менялись.
+
+    Валидаторы считаются по версиям областей version_scopes, поэтому
+    для проверки не нужно ни строить ответ, ни ходить в базу.
+    """
+    version_scopes = ()
+
+    def get_validators(self):
+        versions = get_versions(*self.version_scopes)
+        return make_validators(*versions, modified=max(versions))
+
+    def conditional_response(self, request, get_response):
+        validators = self.get_validators()
+        if validators is None:
+            return get_response()
+        etag, last_modified = validators
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = get_response()
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+
+class ConditionalListRetrieveViewSet(ConditionalGetMixin, ListRetrieveViewSet):
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            request, partial(super().list, request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            request, partial(super().retrieve, request, *args, **kwargs))
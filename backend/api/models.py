@@ -0,0 +1,51 @@
+from django.db import models
+
+
+class RequestProfile(models.Model):
+    endpoint = models.CharField(
+        max_length=200,
+        db_index=True,
+        verbose_name='Обработчик'
+    )
+    method = models.CharField(
+        max_length=10,
+        verbose_name='Метод'
+    )
+    path = models.TextField(
+        verbose_name='Адрес'
+    )
+    status_code = models.IntegerField(
+        verbose_name='Код ответа'
+    )
+    duration = models.FloatField(
+        verbose_name='Время, мс'
+    )
+    memory_peak = models.BigIntegerField(
+        verbose_name='Пик памяти, байт',
+        help_text='По данным tracemalloc за время запроса'
+    )
+    stats_file = models.CharField(
+        max_length=500,
+        verbose_name='Файл pstats',
+        help_text='Открывается pstats, snakeviz или flameprof'
+    )
+    functions = models.TextField(
+        verbose_name='Функции',
+        help_text='Самые долгие по суммарному времени'
+    )
+    allocations = models.TextField(
+        verbose_name='Выделения памяти',
+        help_text='Строки кода, выделившие больше всего памяти'
+    )
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Снят'
+    )
+
+    class Meta:
+        verbose_name = 'Профиль запроса'
+        verbose_name_plural = 'Профили запросов'
+        ordering = ['-created', ]
+
+    def __str__(self) -> str:
+        return f'{self.method} {self.path} ({self.duration:.0f} мс)'
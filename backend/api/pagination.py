@@ -1,5 +1,94 @@
-from rest_framework.pagination import PageNumberPagination
+from collections import OrderedDict
+
+from django.db import connections
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+
+
+def estimate_count(queryset):
+    """Оценка числа строк по плану запроса PostgreSQL.
+
+    На остальных СУБД оценки нет, поэтому выполняется обычный COUNT.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class LimitCursorPagination(CursorPagination):
+    """Keyset-пагинация: без COUNT(*) и без OFFSET-сканирования.
+
+    Количество объектов не считается, пока клиент не попросит
+    ?count=estimate (оценка) или ?count=exact.
+    """
+    page_size_query_param = 'limit'
+    ordering = ('-pub_date', 'id')
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        count_mode = request.query_params.get(self.count_query_param)
+        self.count = None
+        if count_mode == 'exact':
+            self.count = queryset.count()
+        elif count_mode == 'estimate':
+            self.count = estimate_count(queryset)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        response = OrderedDict()
+        if self.count is not None:
+            response['count'] = self.count
+        response['next'] = self.get_next_link()
+        response['previous'] = self.get_previous_link()
+        response['results'] = data
+        return Response(response)
+
+
+class FollowCursorPagination(LimitCursorPagination):
+    ordering = ('-id',)
 
 
 class LimitPageNumberPagination(PageNumberPagination):
+    """Постраничная пагинация с параметром limit.
+
+    Если задан cursor_pagination_class, то по ?pagination=cursor
+    (или при наличии ?cursor=...) страница отдаётся keyset-пагинацией,
+    а обычный режим ?page=... остаётся для фронтенда.
+    """
     page_size_query_param = 'limit'
+    cursor_pagination_class = None
+    mode_query_param = 'pagination'
+
+    def use_cursor(self, request):
+        if self.cursor_pagination_class is None:
+            return False
+        return (
+            request.query_params.get(self.mode_query_param) == 'cursor'
+            or 'cursor' in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        if self.use_cursor(request):
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class RecipePagination(LimitPageNumberPagination):
+    cursor_pagination_class = LimitCursorPagination
+
+
+class FollowPagination(LimitPageNumberPagination):
+    cursor_pagination_class = FollowCursorPagination
@@ -1,6 +1,14 @@
 from rest_framework.permissions import BasePermission, SAFE_METHODS
 
 
+class IsAdmin(BasePermission):
+    """Администратор по роли или сотрудник (User.is_admin)."""
+
+    def has_permission(self, request, view):
+        return bool(
+            request.user.is_authenticated and request.user.is_admin)
+
+
 class AdminUserOrReadOnly(BasePermission):
     def has_permission(self, request, view):
         return (
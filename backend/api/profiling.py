@@ -0,0 +1,127 @@
+import cProfile
+import io
+import os
+import pstats
+import random
+import threading
+import time
+import tracemalloc
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils import timezone
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+from .metrics import get_endpoint
+from .models import RequestProfile
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 20
+
+# tracemalloc общий на процесс, поэтому профилируется один запрос за раз.
+profile_lock = threading.Lock()
+
+
+def is_admin(request):
+    """Администратор (User.is_admin) по сессии или по токену API."""
+    if getattr(request.user, 'is_admin', False):
+        return True
+    try:
+        authenticated = TokenAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return False
+    return authenticated is not None and authenticated[0].is_admin
+
+
+def save_profile(request, response, profiler, snapshot, peak, duration):
+    endpoint = request._profile_endpoint
+    os.makedirs(settings.PROFILES_DIR, exist_ok=True)
+    stats_file = os.path.join(
+        settings.PROFILES_DIR,
+        f'{timezone.now():%Y%m%d-%H%M%S}-{endpoint}-{uuid4().hex[:8]}.pstats'
+    )
+    profiler.dump_stats(stats_file)
+    functions = io.StringIO()
+    pstats.Stats(profiler, stream=functions).sort_stats(
+        'cumulative').print_stats(TOP_FUNCTIONS)
+    return RequestProfile.objects.create(
+        endpoint=endpoint,
+        method=request.method,
+        path=request.get_full_path(),
+        status_code=response.status_code,
+        duration=duration * 1000,
+        memory_peak=peak,
+        stats_file=stats_file,
+        functions=functions.getvalue(),
+        allocations='\n'.join(
+            str(stat)
+            for stat in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]
+        )
+    )
+
+
+class ProfilingMiddleware:
+    """Профилирует отдельные запросы cProfile и tracemalloc.
+
+    Выключена, пока PROFILING_ENABLED не True: тогда Django не добавляет
+    её в цепочку и накладных расходов нет. Профилируется запрос
+    администратора с заголовком X-Profile или случайная доля
+    PROFILING_SAMPLE_RATE запросов к /api/. Файл pstats пишется
+    в PROFILES_DIR, сводка - в RequestProfile, а id профиля
+    возвращается в заголовке X-Profile-Id. У потоковых ответов
+    профилируется только часть до отдачи заголовков.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def should_profile(self, request):
+        if request.META.get(PROFILE_HEADER):
+            return is_admin(request)
+        return (
+            request.path.startswith('/api/')
+            and random.random() < settings.PROFILING_SAMPLE_RATE
+        )
+
+    def __call__(self, request):
+        if (
+            not self.should_profile(request)
+            or not profile_lock.acquire(blocking=False)
+        ):
+            return self.get_response(request)
+        try:
+            return self.profile(request)
+        finally:
+            profile_lock.release()
+
+    def profile(self, request):
+        request._profile_endpoint = 'unmatched'
+        profiler = cProfile.Profile()
+        tracing = tracemalloc.is_tracing()
+        if not tracing:
+            tracemalloc.start()
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+            duration = time.perf_counter() - started
+            snapshot = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+            if not tracing:
+                tracemalloc.stop()
+        profile = save_profile(
+            request, response, profiler, snapshot, peak, duration)
+        response['X-Profile-Id'] = str(profile.pk)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if hasattr(request, '_profile_endpoint'):
+            request._profile_endpoint = get_endpoint(
+                view_func, request.method)
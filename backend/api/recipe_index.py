@@ -0,0 +1,260 @@
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from recipes.models import Recipe, Tag
+from recipes.versions import get_versions
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Рецепт, сохранённый до отметки синхронизации, но закоммиченный после
+# неё, всё равно попадёт в следующую дочитку благодаря этому запасу.
+SYNC_MARGIN = timedelta(minutes=1)
+# Размер группы id для сверки с базой и число разошедшихся групп,
+# после которого индекс проще построить заново.
+BUCKET_SIZE = 1024
+MAX_STALE_BUCKETS = 64
+
+
+class RecipeIndex:
+    """Колоночный индекс рецептов в памяти процесса для списка рецептов.
+
+    Рецепты хранятся в порядке (-pub_date, id): массивы id, даты, автора
+    и времени приготовления и матрица принадлежности тегам (по
+    столбцу-битсету на тег). Фильтры по тегам (любой или все), автору
+    и диапазону времени приготовления считаются векторно, а из базы
+    читается только страница по id.
+
+    Версии 'recipes' и 'tags' проверяются не чаще раза в
+    RECIPE_INDEX_REFRESH_INTERVAL секунд. Когда меняется 'recipes',
+    индекс дочитывает рецепты с updated_at после прошлой синхронизации,
+    а удалённые и пропущенные дочиткой рецепты находит по контрольным
+    суммам id в группах по BUCKET_SIZE: из базы перечитываются id только
+    тех групп, где суммы разошлись. Заново индекс строится при смене
+    версии 'tags' и когда старше RECIPE_INDEX_MAX_AGE. Пока другой поток
+    обновляет индекс, запросы идут в SQL.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.state = None
+        self.checked_at = 0
+
+    @property
+    def enabled(self):
+        return np is not None and settings.RECIPE_INDEX_ENABLED
+
+    def load(self, queryset, tag_columns):
+        rows = list(queryset.values_list(
+            'pk', 'pub_date', 'author_id', 'cooking_time'))
+        ids = np.array([row[0] for row in rows], dtype=np.int64)
+        positions = {pk: position for position, pk in enumerate(ids.tolist())}
+        tags = np.zeros((len(rows), len(tag_columns)), dtype=bool)
+        for recipe_id, tag_id in Recipe.tags.through.objects.filter(
+            recipe__in=queryset.values('pk')
+        ).values_list('recipe_id', 'tag_id'):
+            if recipe_id in positions and tag_id in tag_columns:
+                tags[positions[recipe_id], tag_columns[tag_id]] = True
+        return {
+            'ids': ids,
+            'pub_dates': np.array(
+                [row[1].timestamp() for row in rows], dtype=np.float64),
+            'authors': np.array([row[2] for row in rows], dtype=np.int64),
+            'cooking_times': np.array(
+                [row[3] for row in rows], dtype=np.int64),
+            'tags': tags,
+        }
+
+    def make_state(self, columns, base, versions, synced_at):
+        order = np.lexsort((columns['ids'], -columns['pub_dates']))
+        state = {name: array[order] for name, array in columns.items()}
+        state.update(base=base, versions=versions, synced_at=synced_at)
+        return state
+
+    def build(self, versions):
+        synced_at = timezone.now()
+        tag_columns = {}
+        slugs = {}
+        for column, (pk, slug) in enumerate(
+            Tag.objects.order_by('pk').values_list('pk', 'slug')
+        ):
+            tag_columns[pk] = column
+            slugs[slug] = column
+        base = {
+            'tag_columns': tag_columns,
+            'slugs': slugs,
+            'built_at': time.monotonic()
+        }
+        return self.make_state(
+            self.load(Recipe.objects.all(), tag_columns),
+            base, versions, synced_at)
+
+    def is_expired(self, state):
+        return (
+            time.monotonic() - state['base']['built_at']
+            > settings.RECIPE_INDEX_MAX_AGE
+        )
+
+    def is_current(self, state, versions):
+        return (
+            state is not None
+            and state['versions'] == versions
+            and not self.is_expired(state)
+        )
+
+    def checksums(self, ids):
+        """{группа id: (число, сумма)} - то же, что считает база."""
+        buckets, inverse, counts = np.unique(
+            ids // BUCKET_SIZE, return_inverse=True, return_counts=True)
+        sums = np.zeros(len(buckets), dtype=np.int64)
+        np.add.at(sums, inverse, ids)
+        return {
+            bucket: (count, total) for bucket, count, total in zip(
+                buckets.tolist(), counts.tolist(), sums.tolist())
+        }
+
+    def reconcile(self, columns, tag_columns):
+        """Сверяет id с базой по группам; None, если проще собрать заново.
+
+        Удаление и пропущенная дочиткой вставка в одной группе меняют
+        сумму id, даже если число рецептов в ней прежнее.
+        """
+        stored = {
+            row['bucket']: (row['count'], row['total'])
+            for row in Recipe.objects.order_by().annotate(
+                bucket=F('pk') / BUCKET_SIZE
+            ).values('bucket').annotate(count=Count('pk'), total=Sum('pk'))
+        }
+        indexed = self.checksums(columns['ids'])
+        stale = [
+            bucket for bucket in stored.keys() | indexed.keys()
+            if stored.get(bucket) != indexed.get(bucket)
+        ]
+        if not stale:
+            return columns
+        if len(stale) > MAX_STALE_BUCKETS:
+            return None
+        ranges = Q()
+        for bucket in stale:
+            ranges |= Q(pk__gte=bucket * BUCKET_SIZE,
+                        pk__lt=(bucket + 1) * BUCKET_SIZE)
+        ids = np.fromiter(
+            Recipe.objects.filter(ranges).order_by().values_list(
+                'pk', flat=True),
+            dtype=np.int64)
+        present = (
+            ~np.isin(columns['ids'] // BUCKET_SIZE, stale)
+            | np.isin(columns['ids'], ids)
+        )
+        columns = {name: array[present] for name, array in columns.items()}
+        missing = np.setdiff1d(ids, columns['ids'])
+        if len(missing):
+            added = self.load(
+                Recipe.objects.filter(pk__in=missing.tolist()), tag_columns)
+            columns = {
+                name: np.concatenate((array, added[name]))
+                for name, array in columns.items()
+            }
+        return columns
+
+    def refresh(self, state, versions):
+        """Дочитывает изменения рецептов; None, если нужна полная сборка."""
+        base = state['base']
+        if versions[1] != state['versions'][1] or self.is_expired(state):
+            return None
+        synced_at = timezone.now()
+        changed = self.load(
+            Recipe.objects.filter(
+                updated_at__gte=state['synced_at'] - SYNC_MARGIN),
+            base['tag_columns']
+        )
+        keep = ~np.isin(state['ids'], changed['ids'])
+        columns = self.reconcile(
+            {
+                name: np.concatenate((state[name][keep], array))
+                for name, array in changed.items()
+            },
+            base['tag_columns']
+        )
+        if columns is None:
+            return None
+        return self.make_state(columns, base, versions, synced_at)
+
+    def is_checked(self, state):
+        return (
+            state is not None
+            and not self.is_expired(state)
+            and time.monotonic() - self.checked_at
+            <= settings.RECIPE_INDEX_REFRESH_INTERVAL
+        )
+
+    def current(self, strict=False):
+        """Актуальное состояние индекса или None, если идти в SQL.
+
+        Версии читаются из базы, только когда прошлая проверка старше
+        RECIPE_INDEX_REFRESH_INTERVAL или strict: ответ, который ляжет
+        в кеш под текущими версиями, не должен строиться по старому
+        индексу.
+        """
+        state = self.state
+        if not strict and self.is_checked(state):
+            return state
+        versions = get_versions('recipes', 'tags')
+        if self.is_current(state, versions):
+            self.checked_at = time.monotonic()
+            return state
+        if not self.lock.acquire(blocking=False):
+            return None
+        try:
+            state = self.state
+            if not self.is_current(state, versions):
+                state = state and self.refresh(state, versions)
+                self.state = state or self.build(versions)
+            self.checked_at = time.monotonic()
+            return self.state
+        except DatabaseError:
+            return None
+        finally:
+            self.lock.release()
+
+    def select(self, tags=(), all_tags=False, author=None,
+               min_cooking_time=None, max_cooking_time=None, strict=False):
+        """id рецептов в порядке (-pub_date, id) или None.
+
+        None означает, что ответ должен дать SQL: индекс выключен,
+        обновляется в другом потоке или в запросе неизвестный тег.
+        """
+        if not self.enabled:
+            return None
+        state = self.current(strict)
+        if state is None:
+            return None
+        mask = np.ones(len(state['ids']), dtype=bool)
+        if tags:
+            slugs = state['base']['slugs']
+            if any(slug not in slugs for slug in tags):
+                return None
+            members = state['tags'][:, [slugs[slug] for slug in tags]]
+            mask &= members.all(axis=1) if all_tags else members.any(axis=1)
+        if author is not None:
+            mask &= state['authors'] == author
+        if min_cooking_time is not None:
+            mask &= state['cooking_times'] >= min_cooking_time
+        if max_cooking_time is not None:
+            mask &= state['cooking_times'] <= max_cooking_time
+        return state['ids'][mask]
+
+    def warm_up(self):
+        if self.enabled:
+            self.current()
+
+
+recipe_index = RecipeIndex()
@@ -0,0 +1,127 @@
+from django.db import transaction
+
+from recipes.cart import change_carts_for_recipes
+from recipes.counters import change_favorites_count, change_followers_count
+from recipes.models import FavoriteRecipe, Recipe, ShoppingList
+from recipes.queries import delete_without_signals, insert_ignore_conflicts
+from recipes.versions import bump_version
+from users.models import Follow, User
+
+CREATED = 'created'
+EXISTS = 'exists'
+DELETED = 'deleted'
+MISSING = 'missing'
+NOT_FOUND = 'not_found'
+SELF = 'self'
+
+
+class Relation:
+    """Связь пользователя с рецептом или автором.
+
+    Вставка и удаление идут мимо сигналов и не трогают счётчики,
+    корзины и версии кэша, поэтому relation применяет эти изменения сам.
+    """
+
+    def __init__(self, model, field, target_model, on_change,
+                 allow_self=True):
+        self.model = model
+        self.field = field
+        self.target_model = target_model
+        self.on_change = on_change
+        self.allow_self = allow_self
+
+    def existing(self, user, ids):
+        return self.model.objects.filter(
+            user=user, **{f'{self.field}__in': ids})
+
+    def changed(self, user, target_ids, sign):
+        if target_ids:
+            self.on_change(user.pk, target_ids, sign)
+            bump_version(f'user:{user.pk}')
+
+    def add(self, user, target):
+        """Один INSERT; None, если связь уже есть.
+
+        Есть ли связь, решает уникальное ограничение по числу
+        вставленных строк, поэтому предварительная проверка не нужна.
+        """
+        with transaction.atomic():
+            if not insert_ignore_conflicts(
+                self.model,
+                [{'user_id': user.pk, f'{self.field}_id': target.pk}],
+                f'{self.field}_id'
+            ):
+                return None
+            self.changed(user, [target.pk], 1)
+        return self.model(user=user, **{self.field: target})
+
+    def remove(self, user, target_id):
+        """Один DELETE; число удалённых строк показывает, была ли связь."""
+        with transaction.atomic():
+            deleted = delete_without_signals(
+                self.existing(user, [target_id]))
+            if deleted:
+                self.changed(user, [target_id], -1)
+        return bool(deleted)
+
+    def bulk_add(self, user, ids):
+        """Добавляет связи одним INSERT, возвращает {id: статус}.
+
+        Уже существующие связи отсеивает уникальное ограничение:
+        created - только строки, которые вставил этот INSERT.
+        """
+        with transaction.atomic():
+            found = set(self.target_model.objects.filter(
+                pk__in=ids).values_list('pk', flat=True))
+            candidates = [
+                pk for pk in ids
+                if pk in found and (self.allow_self or pk != user.pk)
+            ]
+            created = insert_ignore_conflicts(
+                self.model,
+                [
+                    {'user_id': user.pk, f'{self.field}_id': pk}
+                    for pk in candidates
+                ],
+                f'{self.field}_id'
+            )
+            self.changed(user, created, 1)
+        created = set(created)
+        results = {}
+        for pk in ids:
+            if pk not in found:
+                results[pk] = NOT_FOUND
+            elif not self.allow_self and pk == user.pk:
+                results[pk] = SELF
+            else:
+                results[pk] = CREATED if pk in created else EXISTS
+        return results
+
+    def bulk_remove(self, user, ids):
+        """Удаляет связи одним DELETE, возвращает {id: статус}."""
+        with transaction.atomic():
+            rows = dict(
+                self.existing(user, ids).select_for_update()
+                .values_list('pk', f'{self.field}_id')
+            )
+            delete_without_signals(self.model.objects.filter(pk__in=rows))
+            deleted = set(rows.values())
+            self.changed(user, deleted, -1)
+        return {pk: DELETED if pk in deleted else MISSING for pk in ids}
+
+
+def favorites_changed(user_id, recipe_ids, sign):
+    change_favorites_count({pk: sign for pk in recipe_ids})
+
+
+def cart_changed(user_id, recipe_ids, sign):
+    change_carts_for_recipes([(user_id, pk) for pk in recipe_ids], sign)
+
+
+def follows_changed(user_id, author_ids, sign):
+    change_followers_count({pk: sign for pk in author_ids})
+
+
+FAVORITES = Relation(FavoriteRecipe, 'recipe', Recipe, favorites_changed)
+SHOPPING_CART = Relation(ShoppingList, 'recipe', Recipe, cart_changed)
+FOLLOWS = Relation(Follow, 'author', User, follows_changed, allow_self=False)
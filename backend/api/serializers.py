@@ -1,11 +1,64 @@
+import json
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Manager
 from djoser.serializers import UserCreateSerializer
 from rest_framework import serializers
+from rest_framework.utils import html
 
+from recipes.cart import change_recipe_amounts
+from recipes.counters import save_without_counters
 from recipes.models import (FavoriteRecipe, Ingredient,
                             IngredientAmount, Recipe,
                             ShoppingList, Tag)
+from recipes.queries import delete_without_signals, latest_recipes_by_author
+from recipes.search import index_documents
+from recipes.versions import bump_version
 from users.models import User, Follow
-from .imagefield import ImageConversion
+from .imagefield import ImageConversion, RenditionsField
+
+
+def load_subscriptions(context, author_ids):
+    """Отмечает в контексте, на кого из author_ids подписан пользователь.
+
+    Авторы, которых ещё нет в context['subscriptions'], проверяются
+    одним запросом, поэтому все сериализаторы пользователей в ответе
+    обходятся одним запросом на страницу.
+    """
+    subscriptions = context.setdefault('subscriptions', {})
+    missing = {pk for pk in author_ids if pk not in subscriptions}
+    if not missing:
+        return subscriptions
+    user = context['request'].user
+    followed = set()
+    if user.is_authenticated:
+        followed = set(Follow.objects.filter(
+            user=user, author_id__in=missing
+        ).values_list('author_id', flat=True))
+    subscriptions.update({pk: pk in followed for pk in missing})
+    return subscriptions
+
+
+class SubscriptionsListSerializer(serializers.ListSerializer):
+    """Загружает подписки сразу для всех пользователей страницы."""
+
+    def get_author_ids(self, items):
+        return [item.pk for item in items]
+
+    def to_representation(self, data):
+        if isinstance(data, Manager):
+            data = data.all()
+        data = list(data)
+        load_subscriptions(self.context, self.get_author_ids(data))
+        return super().to_representation(data)
+
+
+class RecipeListSerializer(SubscriptionsListSerializer):
+
+    def get_author_ids(self, items):
+        return [item.author_id for item in items]
 
 
 class UserSerializer(UserCreateSerializer):
@@ -25,15 +78,16 @@ class UserSerializer(UserCreateSerializer):
         extra_kwargs = {
             'password': {'write_only': True}
         }
+        list_serializer_class = SubscriptionsListSerializer
 
     def get_is_subscribed(self, obj):
-        user = self.context['request'].user
-        if user.is_anonymous:
-            return False
-        followings = Follow.objects.filter(
-            user=user, author=obj
-        )
-        return followings.exists()
+        return load_subscriptions(self.context, [obj.pk])[obj.pk]
+
+    def update(self, instance, validated_data):
+        for field, value in validated_data.items():
+            setattr(instance, field, value)
+        save_without_counters(instance)
+        return instance
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -81,6 +135,7 @@ class RecipeSerializers(serializers.ModelSerializer):
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
     image = serializers.ImageField()
+    renditions = RenditionsField()
 
     class Meta:
         model = Recipe
@@ -93,11 +148,15 @@ class RecipeSerializers(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'renditions',
             'text',
             'cooking_time'
         ]
+        list_serializer_class = RecipeListSerializer
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = self.context['request'].user
         if user.is_anonymous:
             return False
@@ -107,6 +166,8 @@ class RecipeSerializers(serializers.ModelSerializer):
         return favorite.exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user = self.context['request'].user
         if user.is_anonymous:
             return False
@@ -116,11 +177,27 @@ class RecipeSerializers(serializers.ModelSerializer):
         return favorite.exists()
 
 
+class TagListField(serializers.ListField):
+    """Список id тегов, проверяемый одним запросом."""
+    child = serializers.IntegerField()
+
+    def to_internal_value(self, data):
+        ids = super().to_internal_value(data)
+        tags = Tag.objects.in_bulk(ids)
+        errors = {
+            index: [f'Тега с id={tag_id} не существует.']
+            for index, tag_id in enumerate(ids) if tag_id not in tags
+        }
+        if errors:
+            raise serializers.ValidationError(errors)
+        return [tags[tag_id] for tag_id in ids]
+
+    def to_representation(self, value):
+        return [tag.pk for tag in value.all()]
+
+
 class RecipeWriteSerializer(serializers.ModelSerializer):
-    tags = serializers.PrimaryKeyRelatedField(
-        many=True,
-        queryset=Tag.objects.all()
-    )
+    tags = TagListField()
     ingredients = IngredientWriteSerializer(many=True)
     author = serializers.PrimaryKeyRelatedField(
         read_only=True,
@@ -145,6 +222,44 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             'cooking_time'
         ]
 
+    def to_internal_value(self, data):
+        if html.is_html_input(data):
+            data = self.parse_form_data(data)
+        return super().to_internal_value(data)
+
+    def parse_form_data(self, data):
+        """multipart/form-data: ingredients и tags приходят JSON-строками.
+
+        Теги можно передать и повторяющимся полем tags.
+        """
+        values = data.dict()
+        if 'tags' in data:
+            values['tags'] = data.getlist('tags')
+        errors = {}
+        for field in ('tags', 'ingredients'):
+            value = values.get(field)
+            if isinstance(value, list) and len(value) == 1:
+                value = value[0]
+            if not isinstance(value, str) or not value.lstrip().startswith(
+                    ('[', '{')):
+                continue
+            try:
+                values[field] = json.loads(value)
+            except ValueError:
+                errors[field] = ['Ожидается JSON-список.']
+        if errors:
+            raise serializers.ValidationError(errors)
+        return values
+
+    def save(self, **kwargs):
+        try:
+            return super().save(**kwargs)
+        finally:
+            # Временный файл уже перенесён хранилищем, закрываем явно.
+            image = self.validated_data.get('image')
+            if image is not None:
+                image.close()
+
     def validate(self, data):
         ingredients = data.get('ingredients')
         ingredients_id = []
@@ -174,21 +289,116 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             )
         return data
 
-    def add_ingredients_and_tag_to_recipe(self, instance, **validated_data):
-        ingredients = validated_data['ingredients']
-        tags = validated_data['tags']
-        for tag in tags:
-            instance.tags.add(tag)
-        for ingredient in ingredients:
-            IngredientAmount.objects.bulk_create([
-                IngredientAmount(
-                    recipe=instance,
-                    ingredients_id=ingredient.get('id'),
-                    amount=ingredient.get('amount')
-                )
-            ])
+    def add_ingredients_and_tag_to_recipe(self, instance, ingredients, tags,
+                                          created=False):
+        """Сохраняет отличия от текущего состава рецепта.
+
+        Неизменённые строки IngredientAmount остаются на месте, изменённые
+        обновляются одним запросом, новые вставляются одним запросом,
+        теги меняются через промежуточную таблицу. Сигналы для этих
+        операций не срабатывают, поэтому корзины обновляются здесь же.
+        """
+        amounts = {
+            ingredient['id']: ingredient['amount']
+            for ingredient in ingredients
+        }
+        current = {}
+        if not created:
+            current = {
+                ingredient_id: (pk, amount)
+                for pk, ingredient_id, amount in IngredientAmount.objects
+                .filter(recipe=instance)
+                .values_list('pk', 'ingredients_id', 'amount')
+            }
+        removed = [
+            pk for ingredient_id, (pk, _) in current.items()
+            if ingredient_id not in amounts
+        ]
+        changed = [
+            IngredientAmount(pk=current[ingredient_id][0], amount=amount)
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id in current
+            and current[ingredient_id][1] != amount
+        ]
+        added = [
+            IngredientAmount(
+                recipe=instance, ingredients_id=ingredient_id, amount=amount)
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in current
+        ]
+        if removed:
+            delete_without_signals(
+                IngredientAmount.objects.filter(pk__in=removed))
+        if changed:
+            IngredientAmount.objects.bulk_update(changed, ['amount'])
+        if added:
+            IngredientAmount.objects.bulk_create(added)
+        self.set_tags(instance, tags, created)
+        deltas = {
+            ingredient_id: amounts.get(ingredient_id, 0) - amount
+            for ingredient_id, (_, amount) in current.items()
+        }
+        for ingredient in added:
+            deltas[ingredient.ingredients_id] = ingredient.amount
+        if not created:
+            # Нового рецепта ещё нет ни в одной корзине.
+            change_recipe_amounts(instance.pk, deltas)
         return instance
 
+    def set_tags(self, instance, tags, created=False):
+        """tags.set() без m2m_changed: одно чтение, DELETE и INSERT."""
+        through = Recipe.tags.through
+        tag_ids = {tag.pk for tag in tags}
+        current = set()
+        if not created:
+            current = set(through.objects.filter(
+                recipe=instance).values_list('tag_id', flat=True))
+        if current - tag_ids:
+            delete_without_signals(through.objects.filter(
+                recipe=instance, tag_id__in=current - tag_ids))
+        if tag_ids - current:
+            through.objects.bulk_create([
+                through(recipe=instance, tag_id=tag_id)
+                for tag_id in tag_ids - current
+            ])
+
+    def save_recipe(self, instance, save):
+        """Сохраняет рецепт, откладывая версии кеша и поиск.
+
+        Сигналы сохранения рецепта пропускают их, пока у него стоит
+        _batch_side_effects: состав ещё не записан, и они обновляются
+        один раз в apply_side_effects.
+        """
+        instance._batch_side_effects = True
+        try:
+            save()
+        finally:
+            del instance._batch_side_effects
+
+    def apply_side_effects(self, instance, ingredients):
+        """Поиск и версии кеша - один раз на сохранение рецепта."""
+        names = [self.ingredient_names[item['id']] for item in ingredients]
+        index_documents(
+            [(instance.pk, instance.name, ' '.join(names), instance.text)])
+        bump_version(
+            'recipes', 'ingredient_usage', f'author:{instance.author_id}')
+
+    def validate_ingredients(self, ingredients):
+        ids = [ingredient['id'] for ingredient in ingredients]
+        # Названия нужны поисковому индексу после сохранения.
+        existing = self.ingredient_names = dict(
+            Ingredient.objects.filter(pk__in=ids).values_list('pk', 'name'))
+        errors = [
+            {} if ingredient_id in existing else {
+                'id': [f'Ингредиента с id={ingredient_id} не существует.']
+            }
+            for ingredient_id in ids
+        ]
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return ingredients
+
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
@@ -199,33 +409,38 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 'У вас уже есть рецепт с таким названием'
             )
-        recipe = Recipe.objects.create(
-            **validated_data
-        )
-        return self.add_ingredients_and_tag_to_recipe(
+        recipe = Recipe(**validated_data)
+        self.save_recipe(recipe, partial(recipe.save, force_insert=True))
+        self.add_ingredients_and_tag_to_recipe(
             recipe,
             ingredients=ingredients,
-            tags=tags
+            tags=tags,
+            created=True
         )
+        self.apply_side_effects(recipe, ingredients)
+        return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        instance.cooking_time = validated_data.get(
-            'cooking_time', instance.cooking_time
-        )
-        instance.ingredients.clear()
-        instance.tags.clear()
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
-        instance = self.add_ingredients_and_tag_to_recipe(
+        # Прежняя картинка известна, сигналу не нужно читать её из базы.
+        instance._image_previous = instance.image.name
+        for field, value in validated_data.items():
+            setattr(instance, field, value)
+        self.save_recipe(instance, partial(save_without_counters, instance))
+        self.add_ingredients_and_tag_to_recipe(
             instance,
             ingredients=ingredients,
             tags=tags
         )
-        return super().update(instance, validated_data)
+        self.apply_side_effects(instance, ingredients)
+        return instance
 
 
 class FavoriteRecipeSerializer(serializers.ModelSerializer):
     image = serializers.ImageField()
+    renditions = RenditionsField()
 
     class Meta:
         model = Recipe
@@ -233,6 +448,7 @@ class FavoriteRecipeSerializer(serializers.ModelSerializer):
             'id',
             'name',
             'image',
+            'renditions',
             'cooking_time'
         ]
 
@@ -246,7 +462,7 @@ class FollowSerializer(serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
     recipes_count = serializers.IntegerField(
-        source='author.recipes.count',
+        source='author.recipes_count',
         read_only=True
     )
 
@@ -264,14 +480,40 @@ class FollowSerializer(serializers.ModelSerializer):
         ]
 
     def get_is_subscribed(self, obj):
-        followings = Follow.objects.filter(
-            user=obj.user, author=obj.author
-        )
-        return followings.exists()
+        # Подписка obj и есть подписка пользователя на автора.
+        return True
 
     def get_recipes(self, obj):
-        limit = self.context.get('request').GET.get('recipes_limit')
-        queryset = Recipe.objects.filter(author=obj.author)
-        if limit:
-            queryset = queryset[:int(limit)]
-        return FavoriteRecipeSerializer(queryset, many=True).data
+        """Рецепты берутся из контекста, собранного для всей страницы."""
+        recipes = self.context.get('author_recipes')
+        if recipes is None:
+            recipes = latest_recipes_by_author(
+                [obj.author_id], get_recipes_limit(self.context['request']))
+        return FavoriteRecipeSerializer(
+            recipes.get(obj.author_id, []), many=True).data
+
+
+def get_recipes_limit(request):
+    """recipes_limit из запроса: целое неотрицательное, не больше максимума.
+
+    Без параметра отдаётся максимум, а не все рецепты автора.
+    """
+    limit = request.query_params.get('recipes_limit')
+    if limit in (None, ''):
+        return settings.RECIPES_LIMIT_MAX
+    if not limit.isdigit():
+        raise serializers.ValidationError({
+            'recipes_limit': ['Должно быть целым неотрицательным числом.']
+        })
+    return min(int(limit), settings.RECIPES_LIMIT_MAX)
+
+
+class BulkIdsSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=100
+    )
+
+    def validate_ids(self, ids):
+        return list(dict.fromkeys(ids))
@@ -1,15 +1,108 @@
-from django.http import HttpResponse
-
-
-def create_shopping_list(ingredients):
-    shoping_cart = {}
-    for ingredient in ingredients:
-        name = ingredient['ingredients__name']
-        amount = f'{ingredient["total"]} {ingredient["ingredients__measurement_unit"]}'
-        shoping_cart[name] = amount
-    data = ''
-    for key, value in shoping_cart.items():
-        data += f'{key} - {value}\n'
-    response = HttpResponse(data, content_type='text/plain')
-    response['Content-Disposition'] = 'attachment; filename="shopping_cart.txt"'
+import csv
+import io
+import json
+import os
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+
+try:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+    from reportlab.pdfgen import canvas
+except ImportError:
+    canvas = None
+
+CHUNK_SIZE = 500
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def iterate(ingredients):
+    for ingredient in ingredients.iterator(chunk_size=CHUNK_SIZE):
+        yield (
+            ingredient['name'],
+            ingredient['total'],
+            ingredient['measurement_unit']
+        )
+
+
+def txt_rows(ingredients):
+    for name, total, unit in iterate(ingredients):
+        yield f'{name} - {total} {unit}\n'
+
+
+def csv_rows(ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(['name', 'amount', 'measurement_unit'])
+    for row in iterate(ingredients):
+        yield writer.writerow(row)
+
+
+def json_rows(ingredients):
+    separator = '['
+    for name, total, unit in iterate(ingredients):
+        yield separator + json.dumps(
+            {'name': name, 'amount': total, 'measurement_unit': unit},
+            ensure_ascii=False
+        )
+        separator = ',\n'
+    yield '[]' if separator == '[' else ']'
+
+
+def pdf_rows(ingredients):
+    """PDF собирается целиком: формат не позволяет писать его по строкам.
+
+    Нужен reportlab и TTF-шрифт с кириллицей (SHOPPING_LIST_PDF_FONT).
+    """
+    pdfmetrics.registerFont(
+        TTFont('ShoppingList', settings.SHOPPING_LIST_PDF_FONT))
+    buffer = io.BytesIO()
+    page = canvas.Canvas(buffer, pagesize=A4)
+    _, height = A4
+    top = height - 50
+    position = top
+    for name, total, unit in iterate(ingredients):
+        if position < 50:
+            page.showPage()
+            position = top
+        page.setFont('ShoppingList', 12)
+        page.drawString(50, position, f'{name} - {total} {unit}')
+        position -= 18
+    page.save()
+    buffer.seek(0)
+    yield from iter(lambda: buffer.read(64 * 1024), b'')
+
+
+EXPORTERS = {
+    'txt': (txt_rows, 'text/plain; charset=utf-8'),
+    'csv': (csv_rows, 'text/csv; charset=utf-8'),
+    'json': (json_rows, 'application/json'),
+    'pdf': (pdf_rows, 'application/pdf'),
+}
+
+
+def available_formats():
+    return [name for name in EXPORTERS if is_available(name)]
+
+
+def is_available(export_format):
+    return export_format in EXPORTERS and (
+        export_format != 'pdf'
+        or canvas is not None
+        and os.path.exists(settings.SHOPPING_LIST_PDF_FONT)
+    )
+
+
+def create_shopping_list(ingredients, export_format='txt'):
+    rows, content_type = EXPORTERS[export_format]
+    response = StreamingHttpResponse(
+        rows(ingredients), content_type=content_type)
+    response['Content-Disposition'] = (
+        f'attachment; filename="shopping_cart.{export_format}"'
+    )
     return response
@@ -0,0 +1,81 @@
+import base64
+import io
+from itertools import count
+
+from django.core.files.base import ContentFile
+from PIL import Image
+
+from recipes.models import (FavoriteRecipe, Ingredient, IngredientAmount,
+                            Recipe, ShoppingList, Tag)
+from users.models import Follow, User
+
+sequence = count(1)
+
+
+def make_png():
+    buffer = io.BytesIO()
+    Image.new('RGB', (40, 30), (230, 160, 90)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def image_data():
+    """Картинка в base64, как её присылает фронтенд."""
+    return 'data:image/png;base64,' + base64.b64encode(make_png()).decode()
+
+
+def create_user(**fields):
+    number = next(sequence)
+    fields = {
+        'username': f'user{number}',
+        'email': f'user{number}@example.com',
+        'first_name': 'Тест',
+        'last_name': f'Пользователь {number}',
+        **fields
+    }
+    # Без пароля не тратится время на хеширование.
+    return User.objects.create_user(password=None, **fields)
+
+
+def create_tag(**fields):
+    number = next(sequence)
+    return Tag.objects.create(
+        **{'name': f'Тег {number}', 'slug': f'tag{number}', **fields})
+
+
+def create_ingredient(**fields):
+    number = next(sequence)
+    return Ingredient.objects.create(
+        **{'name': f'ингредиент {number}', 'measurement_unit': 'г',
+           **fields})
+
+
+def create_recipe(author=None, tags=(), ingredients=(), **fields):
+    """Рецепт через ORM, чтобы счётчики и корзины обновили сигналы."""
+    number = next(sequence)
+    recipe = Recipe.objects.create(**{
+        'author': author or create_user(),
+        'name': f'Рецепт {number}',
+        'text': 'Вкусный суп с картошкой',
+        'cooking_time': 10,
+        'image': ContentFile(make_png(), name=f'recipe{number}.png'),
+        **fields
+    })
+    recipe.tags.set(tags)
+    for ingredient in ingredients:
+        IngredientAmount.objects.create(
+            recipe=recipe, ingredients=ingredient, amount=10)
+    return recipe
+
+
+def create_follow(user, author=None):
+    return Follow.objects.create(user=user, author=author or create_user())
+
+
+def create_favorite(user, recipe=None):
+    return FavoriteRecipe.objects.create(
+        user=user, recipe=recipe or create_recipe())
+
+
+def create_cart_item(user, recipe=None):
+    return ShoppingList.objects.create(
+        user=user, recipe=recipe or create_recipe())
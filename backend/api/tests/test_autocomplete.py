@@ -0,0 +1,40 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+
+from api.autocomplete import ingredient_index
+from recipes.versions import bump_version
+from .factories import create_ingredient, create_recipe
+
+PATH = '/api/ingredients/?name=кар'
+
+
+class IngredientAutocompleteTest(APITestCase):
+    def setUp(self):
+        ingredient_index.versions = None
+        self.potato = create_ingredient(name='Картофель')
+        self.carrot = create_ingredient(name='Морковь каротель')
+        self.caramel = create_ingredient(name='карамель')
+
+    def get_ids(self):
+        response = self.client.get(PATH)
+        self.assertEqual(response.status_code, 200)
+        return [item['id'] for item in response.data]
+
+    def test_no_queries(self):
+        self.get_ids()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(PATH)
+            self.client.get(PATH, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(len(context), 0)
+
+    def test_usage_refresh(self):
+        self.assertEqual(
+            self.get_ids(), [self.caramel.pk, self.potato.pk, self.carrot.pk])
+        create_recipe(ingredients=[self.potato])
+        # Версию составов повышает пакет изменений после коммита,
+        # а транзакция теста не коммитится.
+        bump_version('ingredient_usage')
+        ingredient_index.checked_at = 0
+        self.assertEqual(
+            self.get_ids(), [self.potato.pk, self.caramel.pk, self.carrot.pk])
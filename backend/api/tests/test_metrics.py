@@ -0,0 +1,72 @@
+import json
+import os
+import shutil
+import socket
+import tempfile
+import time
+
+from django.test import override_settings
+from rest_framework.test import APITestCase
+
+from api.metrics import merge_files, metrics
+from users.models import UserRole
+from .factories import create_tag, create_user
+
+# Строка файла процесса прошлой версии: без фазы serializer.
+ROW = {
+    'endpoint': 'recipes-list', 'method': 'GET', 'status': '2xx',
+    'duration': {'buckets': [1] + [0] * 11, 'sum': 0.001},
+    'queries': {'buckets': [1] + [0] * 8, 'sum': 1},
+    'db': 0, 'app': 0, 'render': 0
+}
+
+
+class MetricsTest(APITestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def write(self, name, age=0):
+        path = os.path.join(self.directory, f'{name}.json')
+        with open(path, 'w') as file:
+            json.dump([ROW], file)
+        modified = time.time() - age
+        os.utime(path, (modified, modified))
+        return path
+
+    def test_role_admin(self):
+        self.client.force_authenticate(create_user(role=UserRole.ADMIN))
+        with self.settings(METRICS_DIR=self.directory):
+            response = self.client.get('/api/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.client.force_authenticate(create_user())
+        response = self.client.get('/api/metrics/')
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(METRICS_FILE_TTL=60)
+    def test_stale_files(self):
+        host = socket.gethostname()
+        alive = self.write(f'{host}-{os.getpid()}-1')
+        # pid больше pid_max Linux: такого процесса нет.
+        dead = self.write(f'{host}-{2 ** 22 + 1}-1')
+        old = self.write('other-host-1-1', age=120)
+        merged = merge_files(self.directory)
+        stats = merged['recipes-list', 'GET', '2xx']
+        self.assertEqual(stats['queries']['buckets'][0], 1)
+        self.assertEqual(stats['serializer'], 0)
+        self.assertTrue(os.path.exists(alive))
+        self.assertFalse(os.path.exists(dead))
+        self.assertFalse(os.path.exists(old))
+
+    def test_serializer_phase(self):
+        create_tag()
+        metrics.stats.clear()
+        response = self.client.get('/api/tags/')
+        phases = [
+            entry.split(';')[0]
+            for entry in response['Server-Timing'].split(', ')
+        ]
+        self.assertEqual(
+            phases, ['db', 'serializer', 'app', 'render', 'total'])
+        stats = metrics.stats['tags-list', 'GET', '2xx']
+        self.assertGreater(stats['serializer'], 0)
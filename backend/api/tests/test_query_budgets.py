@@ -0,0 +1,340 @@
+import re
+import shutil
+import tempfile
+
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from api.autocomplete import ingredient_index
+from api.recipe_index import recipe_index
+from recipes.versions import get_versions
+from .factories import (create_cart_item, create_favorite, create_follow,
+                        create_ingredient, create_recipe, create_tag,
+                        create_user, image_data)
+
+SAVEPOINT = re.compile(r'(RELEASE |ROLLBACK TO )?SAVEPOINT ')
+
+# Два объёма данных: размер страницы, число подписок, ингредиентов
+# в рецепте и т. п. Запрос должен уложиться в бюджет на обоих.
+SIZES = (2, 12)
+
+# Максимум SQL-запросов на один запрос к эндпоинту, ключ - имя
+# обработчика, как в метриках, и метод, для отдельного режима
+# обработчика - ещё и его название. Бюджет поднимается только
+# вместе с объяснением в ревью, откуда взялся новый запрос.
+QUERY_BUDGETS = {
+    ('users-list', 'GET'): 3,
+    ('users-detail', 'GET'): 2,
+    ('users-me', 'GET'): 2,
+    ('users-subscriptions', 'GET'): 3,
+    ('users-subscribe', 'POST'): 5,
+    ('users-subscribe', 'DELETE'): 3,
+    ('tags-list', 'GET'): 2,
+    ('tags-detail', 'GET'): 2,
+    ('Ingredients-list', 'GET'): 2,
+    ('Ingredients-detail', 'GET'): 2,
+    # Автодополнение ?name= отвечает из индекса в памяти процесса.
+    ('Ingredients-list', 'GET', 'name'): 0,
+    ('recipes-list', 'GET'): 5,
+    ('recipes-detail', 'GET'): 6,
+    ('recipes-create', 'POST'): 12,
+    ('recipes-partial_update', 'PATCH'): 19,
+    ('recipes-favorite', 'POST'): 4,
+    ('recipes-favorite', 'DELETE'): 3,
+    ('recipes-shopping_cart', 'POST'): 6,
+    ('recipes-shopping_cart', 'DELETE'): 6,
+    ('recipes-download_shopping_cart', 'GET'): 2,
+    ('users-subscribe-bulk', 'POST'): 4,
+    ('users-subscribe-bulk', 'DELETE'): 4,
+    ('recipes-favorite-bulk', 'POST'): 4,
+    ('recipes-favorite-bulk', 'DELETE'): 4,
+    ('recipes-shopping_cart-bulk', 'POST'): 6,
+    ('recipes-shopping_cart-bulk', 'DELETE'): 6,
+}
+
+
+class QueryBudgetTestCase(APITestCase):
+    """Проверяет число SQL-запросов эндпоинтов по QUERY_BUDGETS.
+
+    Каждый эндпоинт запрашивается на двух объёмах данных из SIZES:
+    число запросов не должно превышать бюджет и не должно расти
+    вместе с объёмом, иначе это N+1.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.settings_override = override_settings(
+            MEDIA_ROOT=cls.media_root,
+            METRICS_ENABLED=False,
+            PROFILING_ENABLED=False
+        )
+        cls.settings_override.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.settings_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+    def setUp(self):
+        # Ответы и индекс рецептов живут в памяти процесса и не должны
+        # переходить из теста в тест, версии откатываются вместе с базой.
+        cache.clear()
+        recipe_index.state = None
+        ingredient_index.versions = None
+        self.user = create_user()
+        # Строки версий создаёт первая запись в область; в бюджете
+        # считается обычный запрос, а не самый первый на пустой базе.
+        get_versions('recipes', 'tags', 'ingredients', 'ingredient_usage',
+                     f'author:{self.user.pk}', f'user:{self.user.pk}')
+        self.client.force_authenticate(self.user)
+
+    def request(self, method, path, data=None):
+        response = getattr(self.client, method.lower())(
+            path, data, format='json')
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+    def check(self, endpoint, method, prepare, mode=None):
+        """prepare(size) готовит данные и отдаёт (путь, тело)."""
+        key = (endpoint, method, mode) if mode else (endpoint, method)
+        budget = QUERY_BUDGETS[key]
+        counts = []
+        for size in SIZES:
+            path, data = prepare(size)
+            if method == 'GET':
+                # Первый запрос заполняет версии кеша и индекс.
+                self.request(method, path, data)
+            with CaptureQueriesContext(connection) as context:
+                response = self.request(method, path, data)
+            self.assertTrue(
+                status.is_success(response.status_code),
+                f'{method} {path}: {response.status_code} '
+                f'{getattr(response, "data", "")}'
+            )
+            # Точки сохранения появляются из-за транзакции самого теста.
+            queries = [
+                query['sql'] for query in context.captured_queries
+                if not SAVEPOINT.match(query['sql'])
+            ]
+            self.assertLessEqual(
+                len(queries), budget,
+                f'{endpoint} {method}, объём {size}: {len(queries)} '
+                f'запросов при бюджете {budget}\n' + '\n'.join(queries)
+            )
+            counts.append(len(queries))
+        self.assertEqual(
+            len(set(counts)), 1,
+            f'{endpoint} {method}: число запросов растёт с объёмом данных '
+            f'{dict(zip(SIZES, counts))}'
+        )
+
+
+class UsersQueryBudgetTest(QueryBudgetTestCase):
+    def test_list(self):
+        def prepare(size):
+            for _ in range(size):
+                create_follow(self.user)
+            return f'/api/users/?limit={size}', None
+        self.check('users-list', 'GET', prepare)
+
+    def test_detail(self):
+        def prepare(size):
+            author = create_user()
+            for _ in range(size):
+                create_follow(create_user(), author)
+            return f'/api/users/{author.pk}/', None
+        self.check('users-detail', 'GET', prepare)
+
+    def test_me(self):
+        self.check('users-me', 'GET', lambda size: ('/api/users/me/', None))
+
+    def test_subscriptions(self):
+        def prepare(size):
+            for _ in range(size):
+                author = create_follow(self.user).author
+                for _ in range(size):
+                    create_recipe(author)
+            return f'/api/users/subscriptions/?limit={size}', None
+        self.check('users-subscriptions', 'GET', prepare)
+
+    def test_subscribe(self):
+        authors = {}
+
+        def prepare(size):
+            if size not in authors:
+                authors[size] = create_user()
+                for _ in range(size):
+                    create_recipe(authors[size])
+                    create_follow(self.user)
+            return f'/api/users/{authors[size].pk}/subscribe/', None
+        self.check('users-subscribe', 'POST', prepare)
+        self.check('users-subscribe', 'DELETE', prepare)
+
+
+class CatalogQueryBudgetTest(QueryBudgetTestCase):
+    def test_tags(self):
+        def prepare(size):
+            for _ in range(size):
+                create_tag()
+            return '/api/tags/', None
+        self.check('tags-list', 'GET', prepare)
+        self.check(
+            'tags-detail', 'GET',
+            lambda size: (f'/api/tags/{create_tag().pk}/', None))
+
+    def test_ingredients(self):
+        def prepare(size):
+            for _ in range(size):
+                create_ingredient()
+            return '/api/ingredients/', None
+        self.check('Ingredients-list', 'GET', prepare)
+
+    def test_ingredients_autocomplete(self):
+        def prepare(size):
+            for _ in range(size):
+                create_ingredient()
+            return '/api/ingredients/?name=ин', None
+        self.check('Ingredients-list', 'GET', prepare, mode='name')
+        self.check(
+            'Ingredients-detail', 'GET',
+            lambda size: (f'/api/ingredients/{create_ingredient().pk}/',
+                          None))
+
+
+class RecipesQueryBudgetTest(QueryBudgetTestCase):
+    def create_recipes(self, count, size):
+        tags = [create_tag() for _ in range(size)]
+        ingredients = [create_ingredient() for _ in range(size)]
+        recipes = []
+        for _ in range(count):
+            recipe = create_recipe(tags=tags, ingredients=ingredients)
+            create_favorite(self.user, recipe)
+            create_cart_item(self.user, recipe)
+            recipes.append(recipe)
+        return recipes
+
+    def test_list(self):
+        def prepare(size):
+            self.create_recipes(size, size)
+            return f'/api/recipes/?limit={size}', None
+        self.check('recipes-list', 'GET', prepare)
+
+    def test_filtered_list(self):
+        def prepare(size):
+            self.create_recipes(size, size)
+            return f'/api/recipes/?limit={size}&is_favorited=1', None
+        self.check('recipes-list', 'GET', prepare)
+
+    def test_detail(self):
+        def prepare(size):
+            recipe, = self.create_recipes(1, size)
+            return f'/api/recipes/{recipe.pk}/', None
+        self.check('recipes-detail', 'GET', prepare)
+
+    def make_payload(self, size):
+        return {
+            'name': f'Новый рецепт {size}',
+            'text': 'Описание',
+            'cooking_time': 15,
+            'image': image_data(),
+            'tags': [create_tag().pk for _ in range(size)],
+            'ingredients': [
+                {'id': create_ingredient().pk, 'amount': 5}
+                for _ in range(size)
+            ],
+        }
+
+    def test_create(self):
+        self.check(
+            'recipes-create', 'POST',
+            lambda size: ('/api/recipes/', self.make_payload(size)))
+
+    def test_update(self):
+        def prepare(size):
+            recipe, = self.create_recipes(1, size)
+            recipe.author = self.user
+            recipe.save()
+            return f'/api/recipes/{recipe.pk}/', self.make_payload(size)
+        self.check('recipes-partial_update', 'PATCH', prepare)
+
+
+class RelationsQueryBudgetTest(QueryBudgetTestCase):
+    """Избранное и корзина: у пользователя уже size связей."""
+
+    def prepare_toggle(self, create):
+        recipes = {}
+
+        def prepare(size):
+            if size not in recipes:
+                ingredients = [create_ingredient() for _ in range(size)]
+                for _ in range(size):
+                    create(self.user, create_recipe(ingredients=ingredients))
+                recipes[size] = create_recipe(ingredients=ingredients)
+            return recipes[size].pk, None
+        return prepare
+
+    def check_toggle(self, endpoint, create):
+        prepare = self.prepare_toggle(create)
+        url = '/api/recipes/{}/{}/'.format
+        action = endpoint.split('-')[1]
+
+        def path(size):
+            pk, data = prepare(size)
+            return url(pk, action), data
+        self.check(endpoint, 'POST', path)
+        self.check(endpoint, 'DELETE', path)
+
+    def test_favorite(self):
+        self.check_toggle('recipes-favorite', create_favorite)
+
+    def test_shopping_cart(self):
+        self.check_toggle('recipes-shopping_cart', create_cart_item)
+
+    def check_bulk(self, endpoint, path, create_target, create):
+        """size целей, половина уже связана, плюс несуществующий id."""
+        targets = {}
+
+        def prepare(size):
+            if size not in targets:
+                ingredients = [create_ingredient() for _ in range(size)]
+                targets[size] = [
+                    create_target(ingredients) for _ in range(size)]
+                for target in targets[size][::2]:
+                    create(self.user, target)
+            ids = [target.pk for target in targets[size]]
+            return path, {'ids': ids + [max(ids) + 1000]}
+        self.check(endpoint, 'POST', prepare)
+        self.check(endpoint, 'DELETE', prepare)
+
+    def test_favorite_bulk(self):
+        self.check_bulk(
+            'recipes-favorite-bulk', '/api/recipes/favorite/',
+            lambda ingredients: create_recipe(ingredients=ingredients),
+            create_favorite)
+
+    def test_shopping_cart_bulk(self):
+        self.check_bulk(
+            'recipes-shopping_cart-bulk', '/api/recipes/shopping_cart/',
+            lambda ingredients: create_recipe(ingredients=ingredients),
+            create_cart_item)
+
+    def test_subscribe_bulk(self):
+        self.check_bulk(
+            'users-subscribe-bulk', '/api/users/subscribe/',
+            lambda ingredients: create_user(), create_follow)
+
+    def test_download_shopping_cart(self):
+        def prepare(size):
+            ingredients = [create_ingredient() for _ in range(size)]
+            for _ in range(size):
+                create_cart_item(
+                    self.user, create_recipe(ingredients=ingredients))
+            return '/api/recipes/download_shopping_cart/', None
+        self.check('recipes-download_shopping_cart', 'GET', prepare)
@@ -0,0 +1,215 @@
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from api.recipe_index import recipe_index
+from recipes.models import Recipe
+from .factories import (create_cart_item, create_favorite, create_ingredient,
+                        create_recipe, create_tag, create_user)
+
+# Картинка не читается при выдаче списка, файл не нужен.
+IMAGE = 'recipes/images/test.png'
+
+
+class RecipeListQueriesTest(APITestCase):
+    """Число запросов списка рецептов не зависит от размера страницы."""
+
+    def setUp(self):
+        cache.clear()
+        recipe_index.state = None
+        self.user = create_user()
+        tags = [create_tag() for _ in range(3)]
+        ingredients = [create_ingredient() for _ in range(3)]
+        for number in range(12):
+            recipe = create_recipe(
+                tags=tags, ingredients=ingredients, image=IMAGE)
+            if number % 2:
+                create_favorite(self.user, recipe)
+                create_cart_item(self.user, recipe)
+
+    def count_queries(self, path, limit):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(f'{path}limit={limit}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), limit)
+        return len(context)
+
+    def check_page_sizes(self, path):
+        # Первый запрос заполняет версии кеша и индекс рецептов.
+        self.count_queries(path, 2)
+        self.assertEqual(
+            self.count_queries(path, 2), self.count_queries(path, 6))
+
+    def test_authenticated(self):
+        self.client.force_authenticate(self.user)
+        for path in ('/api/recipes/?', '/api/recipes/?is_favorited=1&'):
+            with self.subTest(path=path):
+                self.check_page_sizes(path)
+
+    def test_anonymous(self):
+        with self.settings(RESPONSE_CACHE_TIMEOUT=0):
+            self.check_page_sizes('/api/recipes/?')
+
+    def test_flags(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get('/api/recipes/?limit=12')
+        flags = {
+            (recipe['is_favorited'], recipe['is_in_shopping_cart'])
+            for recipe in response.data['results']
+        }
+        self.assertEqual(flags, {(True, True), (False, False)})
+
+
+@override_settings(RESPONSE_CACHE_TIMEOUT=0)
+class RecipeIndexTest(APITestCase):
+    """Индекс рецептов не отдаёт удалённые рецепты и не живёт вечно."""
+
+    def setUp(self):
+        cache.clear()
+        recipe_index.state = None
+        self.tag = create_tag()
+        self.recipes = [
+            create_recipe(tags=[self.tag], image=IMAGE) for _ in range(3)]
+        self.path = f'/api/recipes/?tags={self.tag.slug}&limit=10'
+
+    def get_ids(self):
+        response = self.client.get(self.path)
+        self.assertEqual(response.status_code, 200)
+        return {recipe['id'] for recipe in response.data['results']}
+
+    def test_delete_and_create(self):
+        self.get_ids()
+        created = create_recipe(tags=[self.tag], image=IMAGE)
+        # Транзакция закоммитилась позже запаса синхронизации: дочитка
+        # по updated_at этот рецепт не увидит.
+        Recipe.objects.filter(pk=created.pk).update(
+            updated_at=timezone.now() - timedelta(hours=1))
+        self.recipes.pop().delete()
+        self.recipes.append(created)
+        base = recipe_index.state['base']
+        self.assertEqual(
+            self.get_ids(), {recipe.pk for recipe in self.recipes})
+        # Изменения дочитаны, а не собраны заново.
+        self.assertIs(recipe_index.state['base'], base)
+
+    def test_max_age(self):
+        self.get_ids()
+        state = recipe_index.state
+        with self.settings(RECIPE_INDEX_MAX_AGE=0):
+            self.get_ids()
+        self.assertIsNot(recipe_index.state, state)
+
+    def test_filters_match_sql(self):
+        other = create_tag()
+        create_recipe(tags=[self.tag, other], image=IMAGE, cooking_time=30)
+        create_recipe(tags=[other], image=IMAGE, cooking_time=90)
+        author = self.recipes[0].author_id
+        queries = (
+            f'tags={self.tag.slug}&tags={other.slug}',
+            f'tags={self.tag.slug}&tags={other.slug}&tags_mode=all',
+            'min_cooking_time=20&max_cooking_time=60',
+            f'tags={other.slug}&max_cooking_time=60',
+            f'author={author}&min_cooking_time=1',
+        )
+        for query in queries:
+            with self.subTest(query=query):
+                self.path = f'/api/recipes/?{query}&limit=10'
+                indexed = self.get_ids()
+                self.assertTrue(indexed)
+                with self.settings(RECIPE_INDEX_ENABLED=False):
+                    self.assertEqual(indexed, self.get_ids())
+
+    def test_refresh_interval(self):
+        self.client.force_authenticate(create_user())
+        self.get_ids()
+        with CaptureQueriesContext(connection) as context:
+            self.get_ids()
+        self.assertFalse(any(
+            'dataversion' in query['sql']
+            for query in context.captured_queries
+        ))
+        with self.settings(RECIPE_INDEX_REFRESH_INTERVAL=0):
+            with CaptureQueriesContext(connection) as context:
+                self.get_ids()
+        self.assertTrue(any(
+            'dataversion' in query['sql']
+            for query in context.captured_queries
+        ))
+
+
+class RecipeOrderingCacheTest(APITestCase):
+    """Порядок по числу добавлений в избранное не берётся из кеша."""
+
+    def test_favorites_order(self):
+        cache.clear()
+        first, second = (create_recipe(image=IMAGE) for _ in range(2))
+        path = '/api/recipes/?ordering=-favorites_count'
+        create_favorite(create_user(), first)
+        response = self.client.get(path)
+        self.assertEqual(response.data['results'][0]['id'], first.pk)
+        for _ in range(2):
+            create_favorite(create_user(), second)
+        response = self.client.get(path)
+        self.assertEqual(response.data['results'][0]['id'], second.pk)
+
+
+class RecipeDetailTest(APITestCase):
+    def test_invalid_pk(self):
+        response = self.client.get('/api/recipes/abc/')
+        self.assertEqual(response.status_code, 404)
+
+
+class ShoppingCartExportTest(APITestCase):
+    def test_unknown_format(self):
+        self.client.force_authenticate(create_user())
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/?format=xml')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertIn('txt, csv, json', response.data['errors'])
+
+
+class FavoriteToggleTest(APITestCase):
+    def test_add_and_remove(self):
+        self.client.force_authenticate(create_user())
+        recipe = create_recipe(image=IMAGE)
+        path = f'/api/recipes/{recipe.pk}/favorite/'
+        statuses = [self.client.post(path).status_code for _ in range(2)]
+        self.assertEqual(statuses, [201, 400])
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 1)
+        statuses = [self.client.delete(path).status_code for _ in range(2)]
+        self.assertEqual(statuses, [204, 400])
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 0)
+        missing = f'/api/recipes/{recipe.pk + 1}/favorite/'
+        self.assertEqual(self.client.post(missing).status_code, 404)
+
+
+class FavoriteBulkTest(APITestCase):
+    def test_add_and_remove(self):
+        user = create_user()
+        self.client.force_authenticate(user)
+        first, second = (create_recipe(image=IMAGE) for _ in range(2))
+        create_favorite(user, first)
+        missing = second.pk + 1
+        ids = {'ids': [first.pk, second.pk, missing]}
+        response = self.client.post(
+            '/api/recipes/favorite/', ids, format='json')
+        self.assertEqual(
+            [item['status'] for item in response.data['results']],
+            ['exists', 'created', 'not_found'])
+        response = self.client.delete(
+            '/api/recipes/favorite/', ids, format='json')
+        self.assertEqual(
+            [item['status'] for item in response.data['results']],
+            ['deleted', 'deleted', 'missing'])
+        counts = Recipe.objects.filter(
+            pk__in=[first.pk, second.pk]).values_list(
+            'favorites_count', flat=True)
+        self.assertEqual(list(counts), [0, 0])
@@ -1,25 +1,90 @@
-from django.db.models import Sum
+from functools import partial
+
+from django.core.exceptions import ValidationError
+from django.db.models import (BooleanField, Exists, F, OuterRef, Prefetch,
+                              Value)
 from django_filters.rest_framework import DjangoFilterBackend
+from django.http import Http404, HttpResponse
 from django.shortcuts import get_object_or_404
-from rest_framework import filters, status, viewsets
-from rest_framework.decorators import action
-from rest_framework.permissions import AllowAny, IsAuthenticated, SAFE_METHODS
+from django.utils.cache import patch_vary_headers
+from rest_framework import exceptions, filters, status, viewsets
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.permissions import (AllowAny, IsAuthenticated,
+                                        SAFE_METHODS)
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 
 from recipes.models import (FavoriteRecipe, Ingredient, IngredientAmount,
-                            Recipe, ShoppingList, Tag)
+                            Recipe, ShoppingCartItem, ShoppingList, Tag)
+from recipes.counters import COUNTER_FIELDS
+from recipes.queries import latest_recipes_by_author
+from recipes.versions import get_versions
 from users.models import Follow, User
-from .filters import IngredientFilter, RecipeFilter
-from .mixins import ListRetrieveViewSet
-from .pagination import LimitPageNumberPagination
-from .permissions import AdminUserOrReadOnly
-from .services import create_shopping_list
+from .autocomplete import ingredient_index
+from .cache import cached_response
+from .metrics import render_prometheus
+from .filters import (ALL_TAGS, ANY_TAG, IngredientFilter, RecipeFilter,
+                      RecipeOrderingFilter, RecipeSearchFilter)
+from .mixins import (ConditionalGetMixin, ConditionalListRetrieveViewSet,
+                     make_validators)
+from .pagination import (FollowPagination, LimitPageNumberPagination,
+                         RecipePagination)
+from .permissions import AdminUserOrReadOnly, IsAdmin
+from .recipe_index import recipe_index
+from .relations import FAVORITES, FOLLOWS, SHOPPING_CART
+from .renderers import CSVRenderer, PDFRenderer, TextRenderer
+from .services import (available_formats, create_shopping_list,
+                       is_available)
 
-from .serializers import (FavoriteRecipeSerializer, FollowSerializer,
+from .serializers import (BulkIdsSerializer, FavoriteRecipeSerializer,
+                          FollowSerializer, get_recipes_limit,
                           IngredientAmountSerializer, IngredientSerializer,
                           RecipeSerializers, RecipeWriteSerializer,
                           TagSerializer, UserSerializer)
 
+INDEX_FILTERS = {
+    'tags', 'tags_mode', 'author', 'min_cooking_time', 'max_cooking_time'}
+PAGE_PARAMS = {'page', 'limit'}
+
+
+def relation_response(relation, request, targets, pk, serialize, errors):
+    """Добавление (POST) или удаление (DELETE) одной связи.
+
+    errors - тексты ошибок для уже существующей и отсутствующей связи.
+    """
+    if not str(pk).isdigit():
+        raise Http404
+    pk = int(pk)
+    if request.method == 'POST':
+        target = get_object_or_404(targets, pk=pk)
+        instance = relation.add(request.user, target)
+        if instance is None:
+            return Response(
+                {'error': errors[0]}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(serialize(instance), status=status.HTTP_201_CREATED)
+    if relation.remove(request.user, pk):
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    get_object_or_404(targets, pk=pk)
+    return Response(
+        {'error': errors[1]}, status=status.HTTP_400_BAD_REQUEST)
+
+
+def bulk_relation_response(relation, request):
+    """Пакетное добавление (POST) или удаление (DELETE) по списку ids."""
+    serializer = BulkIdsSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    ids = serializer.validated_data['ids']
+    if request.method == 'POST':
+        results = relation.bulk_add(request.user, ids)
+    else:
+        results = relation.bulk_remove(request.user, ids)
+    return Response(
+        {'results': [
+            {'id': pk, 'status': result} for pk, result in results.items()
+        ]},
+        status=status.HTTP_200_OK
+    )
+
 
 class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
@@ -63,10 +128,19 @@ class UserViewSet(viewsets.ModelViewSet):
         current_password = request.data.get('current_password')
         if new_password == current_password:
             user.set_password(new_password)
-            user.save()
+            user.save(update_fields=['password'])
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        url_path='subscribe',
+        permission_classes=(IsAuthenticated,)
+    )
+    def subscribe_bulk(self, request):
+        return bulk_relation_response(FOLLOWS, request)
+
     @action(
         detail=True,
         methods=['post', 'delete'],
@@ -74,78 +148,226 @@ class UserViewSet(viewsets.ModelViewSet):
         pagination_class=LimitPageNumberPagination
     )
     def subscribe(self, request, pk=None):
-        user = get_object_or_404(User, pk=request.user.pk)
-        author = get_object_or_404(User, pk=pk)
-        if request.method == 'POST':
-            if user is author:
-                return Response(
-                    {'errors': 'Вы не можете подписаться на себя.'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            follow = Follow.objects.filter(user=user, author=author)
-            if follow.exists():
-                return Response(
-                    {'error': 'Вы уже подписаны на этого пользователя.'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            follow = Follow.objects.create(user=user, author=author)
-            serializers = FollowSerializer(
-                follow, context={'request': request})
-            return Response(serializers.data, status=status.HTTP_201_CREATED)
-        if request.method == 'DELETE':
-            if user is author:
-                return Response(
-                    {'errors': 'Вы не можете отписаться от самого себя.'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            follow = Follow.objects.filter(user=user, author=author)
-            if not follow.exists():
-                return Response(
-                    {'error': 'Вы не подписаны на этого пользователя.'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            follow.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        return Response(status=status.HTTP_400_BAD_REQUEST)
+        if str(request.user.pk) == str(pk):
+            return Response(
+                {'errors': 'Вы не можете подписаться на себя.'
+                 if request.method == 'POST'
+                 else 'Вы не можете отписаться от самого себя.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return relation_response(
+            FOLLOWS, request, User.objects.all(), pk,
+            lambda follow: FollowSerializer(
+                follow, context={'request': request}).data,
+            ('Вы уже подписаны на этого пользователя.',
+             'Вы не подписаны на этого пользователя.')
+        )
 
-    @action(detail=False, permission_classes=[IsAuthenticated])
+    @action(
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        pagination_class=FollowPagination
+    )
     def subscriptions(self, request):
-        user = request.user
-        queryset = Follow.objects.filter(user=user)
+        limit = get_recipes_limit(request)
+        queryset = Follow.objects.filter(
+            user=request.user).select_related('author').order_by('-id')
         pages = self.paginate_queryset(queryset)
+        author_recipes = latest_recipes_by_author(
+            [follow.author_id for follow in pages], limit)
         serializer = FollowSerializer(
             pages, many=True,
-            context={'request': request}
+            context={'request': request, 'author_recipes': author_recipes}
         )
         return self.get_paginated_response(serializer.data)
 
 
-class TagViewSet(ListRetrieveViewSet):
+class TagViewSet(ConditionalListRetrieveViewSet):
+    version_scopes = ('tags',)
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
 
 
-class IngredientViewSet(ListRetrieveViewSet):
+class IngredientViewSet(ConditionalListRetrieveViewSet):
+    version_scopes = ('ingredients',)
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     pagination_class = None
     filter_backends = (DjangoFilterBackend, filters.SearchFilter)
     filterset_class = IngredientFilter
 
+    def get_validators(self):
+        if self.action != 'list' or 'name' not in self.request.query_params:
+            return super().get_validators()
+        # Поиск отвечает из индекса, валидаторы берутся из его версий.
+        ingredient_index.ensure_current()
+        versions = ingredient_index.versions
+        return make_validators(*versions, modified=max(versions))
+
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name', '').strip()
+        if not name:
+            return super().list(request, *args, **kwargs)
+        return self.conditional_response(
+            request, lambda: Response(ingredient_index.search(name)))
+
 
 class IngredientAmountViewSet(viewsets.ModelViewSet):
     queryset = IngredientAmount.objects.all()
     serializer_class = IngredientAmountSerializer
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
-    queryset = Recipe.objects.all()
-    filter_backends = (DjangoFilterBackend, filters.SearchFilter)
+class RecipeViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
+    filter_backends = (
+        DjangoFilterBackend,
+        RecipeSearchFilter,
+        RecipeOrderingFilter
+    )
     filterset_class = RecipeFilter
-    pagination_class = LimitPageNumberPagination
+    ordering_fields = ('pub_date', 'favorites_count')
+    ordering = ('-pub_date', 'id')
+    pagination_class = RecipePagination
     permission_classes = (AdminUserOrReadOnly,)
 
+    def get_queryset(self):
+        if self.action in ('update', 'partial_update', 'destroy'):
+            return Recipe.objects.select_related('author')
+        queryset = Recipe.objects.select_related('author').prefetch_related(
+            Prefetch('tags', queryset=Tag.objects.all()),
+            Prefetch(
+                'ingredient',
+                queryset=IngredientAmount.objects.select_related(
+                    'ingredients')
+            )
+        )
+        user = self.request.user
+        if user.is_anonymous:
+            return queryset.annotate(
+                is_favorited=Value(False, output_field=BooleanField()),
+                is_in_shopping_cart=Value(False, output_field=BooleanField())
+            )
+        return queryset.annotate(
+            is_favorited=Exists(FavoriteRecipe.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(ShoppingList.objects.filter(
+                user=user, recipe=OuterRef('pk')))
+        )
+
+    def get_cache_scopes(self):
+        author = self.request.query_params.get('author')
+        if self.action == 'list' and author and author.isdigit():
+            return (f'author:{author}', 'tags', 'ingredients')
+        return ('recipes', 'tags', 'ingredients')
+
+    def get_indexed_ids(self, request):
+        """id рецептов из индекса в памяти, если он может ответить.
+
+        Индекс знает только фильтры INDEX_FILTERS и порядок по умолчанию,
+        с остальными параметрами запрос выполняет SQL, как и с неверными
+        значениями: ошибку в ответе даст фильтр. Список без фильтров
+        тоже идёт в SQL: фильтровать в нём нечего, и первая страница
+        сайта не должна зависеть от свежести индекса.
+        """
+        params = request.query_params
+        if (
+            not set(params) <= INDEX_FILTERS | PAGE_PARAMS
+            or not set(params) & INDEX_FILTERS
+            or params.get('tags_mode', ANY_TAG) not in (ANY_TAG, ALL_TAGS)
+        ):
+            return None
+        numbers = {}
+        for name in ('author', 'min_cooking_time', 'max_cooking_time'):
+            value = params.get(name)
+            if value is not None and not value.isdigit():
+                return None
+            numbers[name] = value and int(value)
+        # Ответ анонимному пользователю ляжет в кеш под текущими
+        # версиями, поэтому индекс для него сверяется с базой.
+        return recipe_index.select(
+            params.getlist('tags'),
+            all_tags=params.get('tags_mode') == ALL_TAGS,
+            strict=request.user.is_anonymous,
+            **numbers
+        )
+
+    def list_recipes(self, request, *args, **kwargs):
+        ids = self.get_indexed_ids(request)
+        if ids is None:
+            return super().list(request, *args, **kwargs)
+        page = [int(pk) for pk in self.paginate_queryset(ids)]
+        recipes = self.get_queryset().in_bulk(page)
+        serializer = self.get_serializer(
+            [recipes[pk] for pk in page if pk in recipes], many=True)
+        return self.get_paginated_response(serializer.data)
+
+    def is_cacheable(self):
+        """Можно ли отдать список из кеша ответов.
+
+        Порядок по счётчику меняет каждое добавление в избранное,
+        которое не трогает версию 'recipes', поэтому такой список
+        не кешируется.
+        """
+        ordering = self.request.query_params.get('ordering', '')
+        fields = {field.strip().lstrip('-') for field in ordering.split(',')}
+        return not fields & set(COUNTER_FIELDS)
+
+    def list(self, request, *args, **kwargs):
+        get_response = partial(self.list_recipes, request, *args, **kwargs)
+        if not self.is_cacheable():
+            return get_response()
+        return cached_response(
+            request, self.get_cache_scopes(), get_response)
+
+    def get_validators(self):
+        try:
+            recipe = Recipe.objects.filter(pk=self.kwargs.get('pk')).values(
+                'pk', 'updated_at', 'author_id').first()
+        except (TypeError, ValueError, ValidationError):
+            # Ответ 404 на такой id даст get_object_or_404.
+            return None
+        if recipe is None:
+            return None
+        scopes = ['tags', 'ingredients', f'author:{recipe["author_id"]}']
+        user = self.request.user
+        if user.is_authenticated:
+            scopes.append(f'user:{user.pk}')
+        versions = get_versions(*scopes)
+        updated_at = recipe['updated_at'].timestamp() * 1000
+        return make_validators(
+            recipe['pk'], updated_at, user.pk, *versions,
+            modified=max(updated_at, *versions)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        response = self.conditional_response(request, partial(
+            cached_response,
+            request,
+            self.get_cache_scopes(),
+            partial(super().retrieve, request, *args, **kwargs)
+        ))
+        patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def perform_content_negotiation(self, request, force=False):
+        """Неизвестный формат выгрузки корзины - ошибка 400 в JSON.
+
+        Формат проверяется до согласования: иначе DRF ответил бы 404,
+        а ошибку отрисовал бы рендерером файла.
+        """
+        export_format = request.query_params.get('format', 'txt')
+        if (
+            self.action != 'get_shopping_card'
+            or is_available(export_format)
+        ):
+            return super().perform_content_negotiation(request, force)
+        if force:
+            return JSONRenderer(), JSONRenderer.media_type
+        raise exceptions.ValidationError({'errors': (
+            f'Выгрузка в формате {export_format} недоступна. '
+            f'Доступные форматы: {", ".join(available_formats())}.'
+        )})
+
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
             return RecipeSerializers
@@ -157,6 +379,15 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def perform_update(self, serializer):
         serializer.save(author=self.request.user)
 
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        url_path='favorite',
+        permission_classes=(IsAuthenticated,)
+    )
+    def favorite_bulk(self, request):
+        return bulk_relation_response(FAVORITES, request)
+
     @action(
         detail=True,
         methods=['post', 'delete'],
@@ -164,30 +395,22 @@ class RecipeViewSet(viewsets.ModelViewSet):
         pagination_class=LimitPageNumberPagination
     )
     def favorite(self, request, pk=None):
-        user = get_object_or_404(User, pk=request.user.pk)
-        recipe = get_object_or_404(Recipe, pk=pk)
-        favorited = FavoriteRecipe.objects.filter(
-            user=user, recipe=recipe)
-        if request.method == 'POST':
-            if favorited.exists():
-                return Response(
-                    {'error': 'Вы уже добавили рецепт в избранное.'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            favorited = FavoriteRecipe.objects.create(
-                user=user, recipe=recipe)
-            serializers = FavoriteRecipeSerializer(
-                recipe, context={'request': request})
-            return Response(serializers.data, status=status.HTTP_201_CREATED)
-        if request.method == 'DELETE':
-            if not favorited.exists():
-                return Response(
-                    {'error': 'Этого рецепта не в вашем списке избраного.'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            favorited.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        return Response(status=status.HTTP_400_BAD_REQUEST)
+        return relation_response(
+            FAVORITES, request, Recipe.objects.all(), pk,
+            lambda favorite: FavoriteRecipeSerializer(
+                favorite.recipe, context={'request': request}).data,
+            ('Вы уже добавили рецепт в избранное.',
+             'Этого рецепта не в вашем списке избраного.')
+        )
+
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        url_path='shopping_cart',
+        permission_classes=(IsAuthenticated,)
+    )
+    def shopping_cart_bulk(self, request):
+        return bulk_relation_response(SHOPPING_CART, request)
 
     @action(
         detail=True,
@@ -196,43 +419,40 @@ class RecipeViewSet(viewsets.ModelViewSet):
         pagination_class=LimitPageNumberPagination
     )
     def shopping_cart(self, request, pk=None):
-        user = get_object_or_404(User, pk=request.user.pk)
-        recipe = get_object_or_404(Recipe, pk=pk)
-        in_shopping = ShoppingList.objects.filter(
-            user=user, recipe=recipe)
-        if request.method == 'POST':
-            if in_shopping.exists():
-                return Response(
-                    {'error': 'Вы уже добавили рецепт в список покупок.'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            in_shopping = ShoppingList.objects.create(
-                user=user, recipe=recipe)
-            serializers = FavoriteRecipeSerializer(
-                recipe, context={'request': request})
-            return Response(serializers.data, status=status.HTTP_201_CREATED)
-        if request.method == 'DELETE':
-            if not in_shopping.exists():
-                return Response(
-                    {'error': 'У вас нет этого рецепта в списоке покупок.'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            in_shopping.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        return Response(status=status.HTTP_400_BAD_REQUEST)
+        return relation_response(
+            SHOPPING_CART, request, Recipe.objects.all(), pk,
+            lambda item: FavoriteRecipeSerializer(
+                item.recipe, context={'request': request}).data,
+            ('Вы уже добавили рецепт в список покупок.',
+             'У вас нет этого рецепта в списоке покупок.')
+        )
 
     @action(
         detail=False,
         methods=['get'],
         url_path='download_shopping_cart',
         permission_classes=(IsAuthenticated,),
-        pagination_class=LimitPageNumberPagination
+        pagination_class=LimitPageNumberPagination,
+        renderer_classes=(
+            TextRenderer, CSVRenderer, JSONRenderer, PDFRenderer
+        )
     )
     def get_shopping_card(self, request):
+        export_format = request.query_params.get('format', 'txt')
         user = get_object_or_404(User, pk=request.user.pk)
-        ingredients = IngredientAmount.objects.filter(
-            recipe__shopping_list__user=user).values(
-            'ingredients__name',
-            'ingredients__measurement_unit').order_by(
-            'ingredients__name').annotate(total=Sum('amount'))
-        return create_shopping_list(ingredients)
+        ingredients = ShoppingCartItem.objects.filter(
+            user=user, amount__gt=0).values(
+            name=F('ingredient__name'),
+            measurement_unit=F('ingredient__measurement_unit'),
+            total=F('amount')).order_by('ingredient__name')
+        return create_shopping_list(ingredients, export_format)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdmin])
+def metrics(request):
+    """Метрики запросов всех процессов в формате Prometheus."""
+    return HttpResponse(
+        render_prometheus(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -30,9 +31,11 @@ INSTALLED_APPS = [
     'api.apps.ApiConfig',
     'recipes.apps.RecipesConfig',
     'users.apps.UsersConfig',
+    'jobs.apps.JobsConfig',
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -40,6 +43,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.profiling.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'foodgram.urls'
@@ -82,6 +86,79 @@ DATABASES = {
     }
 }
 '''
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='foodgram'),
+    }
+}
+
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', 60 * 60 * 24))
+
+INGREDIENT_AUTOCOMPLETE_LIMIT = int(
+    os.getenv('INGREDIENT_AUTOCOMPLETE_LIMIT', 20)
+)
+# Как часто (в секундах) индекс автодополнения сверяет версии с базой.
+INGREDIENT_INDEX_REFRESH_INTERVAL = int(
+    os.getenv('INGREDIENT_INDEX_REFRESH_INTERVAL', 5)
+)
+
+# Метрики запросов: каждый процесс сбрасывает свои в файл METRICS_DIR
+# не чаще раза в METRICS_FLUSH_INTERVAL секунд. Файлы, не обновлявшиеся
+# METRICS_FILE_TTL секунд, и файлы умерших процессов удаляются.
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True') == 'True'
+METRICS_DIR = os.getenv(
+    'METRICS_DIR', os.path.join(tempfile.gettempdir(), 'foodgram-metrics'))
+METRICS_FLUSH_INTERVAL = int(os.getenv('METRICS_FLUSH_INTERVAL', 10))
+METRICS_FILE_TTL = int(os.getenv('METRICS_FILE_TTL', 3600))
+
+# Профилирование запросов, по умолчанию выключено: профилируются
+# запросы администратора с заголовком X-Profile и доля
+# PROFILING_SAMPLE_RATE запросов к /api/.
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'False') == 'True'
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', 0))
+PROFILES_DIR = os.getenv('PROFILES_DIR', os.path.join(BASE_DIR, 'profiles'))
+
+# Индекс рецептов в памяти процесса для фильтров списка (нужен numpy).
+RECIPE_INDEX_ENABLED = os.getenv('RECIPE_INDEX_ENABLED', 'True') == 'True'
+# Как часто (в секундах) индекс сверяет версии с базой.
+RECIPE_INDEX_REFRESH_INTERVAL = int(
+    os.getenv('RECIPE_INDEX_REFRESH_INTERVAL', 5)
+)
+# Раз в столько секунд индекс строится заново, а не дочитывается.
+RECIPE_INDEX_MAX_AGE = int(os.getenv('RECIPE_INDEX_MAX_AGE', 10 * 60))
+
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
+# Наибольшее значение recipes_limit в подписках.
+RECIPES_LIMIT_MAX = int(os.getenv('RECIPES_LIMIT_MAX', 50))
+
+RECIPE_IMAGE_MAX_SIZE = int(
+    os.getenv('RECIPE_IMAGE_MAX_SIZE', 10 * 1024 * 1024)
+)
+
+FILE_UPLOAD_MAX_MEMORY_SIZE = int(
+    os.getenv('FILE_UPLOAD_MAX_MEMORY_SIZE', 2621440)
+)
+
+# Фоновые задачи: JOBS_EAGER выполняет их сразу, без очереди (для тестов).
+JOBS_EAGER = os.getenv('JOBS_EAGER', 'False') == 'True'
+JOBS_RETRY_DELAY = int(os.getenv('JOBS_RETRY_DELAY', 30))
+JOBS_STALE_TIMEOUT = int(os.getenv('JOBS_STALE_TIMEOUT', 60 * 10))
+JOBS_KEEP_DAYS = int(os.getenv('JOBS_KEEP_DAYS', 7))
+# Имя: (задача, расписание cron, аргументы...). Время - TIME_ZONE.
+JOBS_SCHEDULE = {
+    'recount_counters': ('recipes.recount_counters', '30 3 * * *'),
+    'fix_shopping_carts': ('recipes.fix_shopping_carts', '0 4 * * *'),
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -0,0 +1,15 @@
+from django.contrib import admin
+
+from .models import Job
+
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = (
+        'task', 'status', 'attempts', 'run_at', 'locked_by', 'finished_at'
+    )
+    list_filter = ('status', 'task')
+    search_fields = ('task', 'key')
+    readonly_fields = ('created', 'locked_at', 'finished_at', 'last_error')
+
+
+admin.site.register(Job, JobAdmin)
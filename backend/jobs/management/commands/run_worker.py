@@ -0,0 +1,78 @@
+import os
+import socket
+import time
+from concurrent.futures import (FIRST_COMPLETED, ProcessPoolExecutor,
+                                ThreadPoolExecutor, wait)
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils import timezone
+
+from jobs.queue import claim, clean_finished, execute, requeue_stale
+from jobs.schedule import enqueue_due
+
+
+class Command(BaseCommand):
+    help = 'Выполняет фоновые задачи из очереди и ставит периодические'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int,
+                            default=os.cpu_count())
+        parser.add_argument('--pool', choices=('thread', 'process'),
+                            default='thread')
+        parser.add_argument('--poll-interval', type=float, default=1.0)
+        parser.add_argument('--once', action='store_true',
+                            help='Выполнить готовые задачи и выйти')
+        parser.add_argument('--no-schedule', action='store_true',
+                            help='Не ставить периодические задачи')
+
+    def make_pool(self, kind, concurrency):
+        if kind == 'process':
+            connections.close_all()
+            return ProcessPoolExecutor(
+                max_workers=concurrency, initializer=django.setup)
+        return ThreadPoolExecutor(max_workers=concurrency)
+
+    def every_minute(self, now, schedule):
+        requeue_stale(settings.JOBS_STALE_TIMEOUT)
+        clean_finished(settings.JOBS_KEEP_DAYS)
+        if schedule:
+            for name in enqueue_due(now):
+                self.stdout.write(f'Запланирована {name}')
+
+    def wait_any(self, running, timeout):
+        if not running:
+            time.sleep(timeout)
+            return running
+        done, running = wait(
+            running, timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception():
+                self.stderr.write(f'Сбой обработчика: {future.exception()!r}')
+        return running
+
+    def handle(self, *args, **options):
+        worker = f'{socket.gethostname()}:{os.getpid()}'
+        concurrency = options['concurrency']
+        pool = self.make_pool(options['pool'], concurrency)
+        running = set()
+        last_minute = None
+        self.stdout.write(f'Обработчик {worker}, потоков: {concurrency}')
+        try:
+            while True:
+                now = timezone.localtime()
+                if now.replace(second=0, microsecond=0) != last_minute:
+                    last_minute = now.replace(second=0, microsecond=0)
+                    self.every_minute(now, not options['no_schedule'])
+                free = concurrency - len(running)
+                for pk in claim(worker, free) if free else []:
+                    running.add(pool.submit(execute, pk))
+                if options['once'] and not running:
+                    break
+                running = self.wait_any(running, options['poll_interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('Остановка: ждём выполняющиеся задачи')
+        finally:
+            pool.shutdown(wait=True)
@@ -0,0 +1,84 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Job(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Выполнена'),
+        (FAILED, 'Ошибка'),
+    )
+
+    task = models.CharField(
+        max_length=100,
+        verbose_name='Задача'
+    )
+    args = models.TextField(
+        default='[]',
+        verbose_name='Аргументы (JSON)'
+    )
+    key = models.CharField(
+        max_length=200,
+        null=True,
+        blank=True,
+        unique=True,
+        verbose_name='Ключ',
+        help_text='Не даёт поставить одну и ту же задачу дважды'
+    )
+    status = models.CharField(
+        max_length=10,
+        choices=STATUSES,
+        default=QUEUED,
+        verbose_name='Статус'
+    )
+    run_at = models.DateTimeField(
+        default=timezone.now,
+        verbose_name='Запустить после'
+    )
+    attempts = models.IntegerField(
+        default=0,
+        verbose_name='Попыток'
+    )
+    max_attempts = models.IntegerField(
+        default=5,
+        verbose_name='Максимум попыток'
+    )
+    locked_by = models.CharField(
+        max_length=100,
+        blank=True,
+        verbose_name='Обработчик'
+    )
+    locked_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Взята в работу'
+    )
+    last_error = models.TextField(
+        blank=True,
+        verbose_name='Последняя ошибка'
+    )
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Создана'
+    )
+    finished_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Завершена'
+    )
+
+    class Meta:
+        verbose_name = 'Задача'
+        verbose_name_plural = 'Задачи'
+        ordering = ['-created', ]
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='job_status_run_at')
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.task} ({self.get_status_display()})'
@@ -0,0 +1,154 @@
+import json
+import logging
+import random
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import (IntegrityError, close_old_connections, connection,
+                       transaction)
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+
+
+def task(name, max_attempts=5):
+    """Регистрирует функцию как фоновую задачу под именем name."""
+    def register(function):
+        TASKS[name] = (function, max_attempts)
+        return function
+    return register
+
+
+def enqueue(name, *args, delay=0, key=None):
+    """Ставит задачу в очередь после завершения текущей транзакции.
+
+    Задача с уже занятым key повторно не ставится.
+    В режиме JOBS_EAGER задача выполняется сразу, без записи в базу:
+    так её результат виден в тестах.
+    """
+    if name not in TASKS:
+        raise KeyError(f'Задача {name} не зарегистрирована')
+    if settings.JOBS_EAGER:
+        TASKS[name][0](*args)
+        return
+    job = Job(
+        task=name,
+        args=json.dumps(args),
+        key=key,
+        max_attempts=TASKS[name][1],
+        run_at=timezone.now() + timedelta(seconds=delay)
+    )
+    transaction.on_commit(lambda: save_job(job))
+
+
+def save_job(job):
+    try:
+        with transaction.atomic():
+            job.save()
+    except IntegrityError:
+        pass
+
+
+def backoff(attempts):
+    """Задержка перед повтором: экспонента с разбросом, не больше часа."""
+    base = settings.JOBS_RETRY_DELAY * 2 ** (attempts - 1)
+    return min(base * random.uniform(0.8, 1.2), 60 * 60)
+
+
+def claim(worker, limit):
+    """Забирает до limit готовых задач.
+
+    Задача достаётся тому, чей UPDATE со статусом queued в условии
+    изменил строку: это работает без SELECT FOR UPDATE SKIP LOCKED.
+    """
+    now = timezone.now()
+    candidates = Job.objects.filter(
+        status=Job.QUEUED, run_at__lte=now
+    ).order_by('run_at').values_list('pk', flat=True)[:limit * 2]
+    claimed = []
+    for pk in candidates:
+        updated = Job.objects.filter(pk=pk, status=Job.QUEUED).update(
+            status=Job.RUNNING, locked_by=worker, locked_at=now)
+        if updated:
+            claimed.append(pk)
+            if len(claimed) == limit:
+                break
+    return claimed
+
+
+def requeue_stale(timeout):
+    """Возвращает в очередь задачи обработчиков, которые не завершились.
+
+    Выполняющаяся задача продлевает locked_at (см. heartbeat), поэтому
+    сюда попадают только задачи упавших или убитых обработчиков.
+    """
+    return Job.objects.filter(
+        status=Job.RUNNING,
+        locked_at__lt=timezone.now() - timedelta(seconds=timeout)
+    ).update(status=Job.QUEUED, locked_by='', locked_at=None)
+
+
+def heartbeat(pk, worker, stop):
+    """Продлевает блокировку задачи, пока не выставлен stop."""
+    interval = settings.JOBS_STALE_TIMEOUT / 3
+    try:
+        while not stop.wait(interval):
+            Job.objects.filter(
+                pk=pk, status=Job.RUNNING, locked_by=worker
+            ).update(locked_at=timezone.now())
+    finally:
+        connection.close()
+
+
+def execute(pk):
+    """Выполняет взятую задачу. Вызывается в потоке или процессе пула."""
+    close_old_connections()
+    try:
+        job = Job.objects.get(pk=pk)
+        stop = threading.Event()
+        beat = threading.Thread(
+            target=heartbeat, args=(pk, job.locked_by, stop), daemon=True)
+        beat.start()
+        try:
+            function, _ = TASKS[job.task]
+            function(*json.loads(job.args))
+        except Exception:
+            job.attempts += 1
+            job.last_error = traceback.format_exc()
+            job.locked_by = ''
+            job.locked_at = None
+            if job.attempts < job.max_attempts:
+                job.status = Job.QUEUED
+                job.run_at = timezone.now() + timedelta(
+                    seconds=backoff(job.attempts))
+            else:
+                job.status = Job.FAILED
+                job.finished_at = timezone.now()
+            logger.warning('Задача %s (%s) упала', job.task, pk)
+        else:
+            job.attempts += 1
+            job.status = Job.DONE
+            job.finished_at = timezone.now()
+        finally:
+            stop.set()
+            beat.join()
+        job.save(update_fields=[
+            'attempts', 'last_error', 'locked_by', 'locked_at', 'status',
+            'run_at', 'finished_at'
+        ])
+        return job.status
+    finally:
+        close_old_connections()
+
+
+def clean_finished(days):
+    return Job.objects.filter(
+        status=Job.DONE,
+        finished_at__lt=timezone.now() - timedelta(days=days)
+    ).delete()[0]
@@ -0,0 +1,71 @@
+from django.conf import settings
+
+from .queue import enqueue
+
+# Минуты, часы, дни месяца, месяцы, дни недели (0 - воскресенье).
+CRON_RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 6))
+
+
+def parse_field(field, low, high):
+    """Разбирает поле cron: *, */5, 1-5, 1,15,30 и их сочетания."""
+    values = set()
+    for part in field.split(','):
+        value, _, step = part.partition('/')
+        step = int(step) if step else 1
+        if value == '*':
+            start, end = low, high
+        elif '-' in value:
+            start, end = map(int, value.split('-'))
+        else:
+            start = end = int(value)
+        if not low <= start <= end <= high or step < 1:
+            raise ValueError(f'Недопустимое поле cron: {field}')
+        values.update(range(start, end + 1, step))
+    return values
+
+
+def parse_cron(expression):
+    fields = expression.split()
+    if len(fields) != len(CRON_RANGES):
+        raise ValueError(f'В выражении cron должно быть 5 полей: {expression}')
+    return [
+        parse_field(field, low, high)
+        for field, (low, high) in zip(fields, CRON_RANGES)
+    ]
+
+
+def matches(expression, moment):
+    """Как в cron: если ограничены и день месяца, и день недели,
+    достаточно совпадения любого из них."""
+    minutes, hours, days, months, weekdays = parse_cron(expression)
+    day_field, weekday_field = expression.split()[2::2]
+    day = moment.day in days
+    weekday = moment.isoweekday() % 7 in weekdays
+    if day_field.startswith('*') or weekday_field.startswith('*'):
+        day_matches = day and weekday
+    else:
+        day_matches = day or weekday
+    return (
+        moment.minute in minutes
+        and moment.hour in hours
+        and moment.month in months
+        and day_matches
+    )
+
+
+def enqueue_due(moment):
+    """Ставит периодические задачи, которым пора выполниться в эту минуту.
+
+    Ключ с именем и минутой не даёт нескольким обработчикам поставить
+    одну задачу дважды.
+    """
+    minute = moment.replace(second=0, microsecond=0)
+    due = []
+    for name, (task_name, expression, *args) in settings.JOBS_SCHEDULE.items():
+        if matches(expression, minute):
+            enqueue(
+                task_name, *args,
+                key=f'schedule:{name}:{minute.isoformat()}'
+            )
+            due.append(name)
+    return due
@@ -0,0 +1,50 @@
+from datetime import datetime
+
+from django.test import SimpleTestCase
+
+from jobs.schedule import matches, parse_cron, parse_field
+
+
+class ParseCronTest(SimpleTestCase):
+    def test_fields(self):
+        self.assertEqual(parse_field('*', 0, 6), set(range(7)))
+        self.assertEqual(parse_field('*/15', 0, 59), {0, 15, 30, 45})
+        self.assertEqual(parse_field('1-5', 0, 6), {1, 2, 3, 4, 5})
+        self.assertEqual(parse_field('1,15,30', 1, 31), {1, 15, 30})
+        self.assertEqual(parse_field('10-20/5,1', 1, 31), {1, 10, 15, 20})
+
+    def test_invalid(self):
+        for field in ('60', '5-1', '*/0', 'x', '1-'):
+            with self.subTest(field=field), self.assertRaises(ValueError):
+                parse_field(field, 0, 59)
+        with self.assertRaises(ValueError):
+            parse_cron('0 3 * *')
+
+
+class MatchesTest(SimpleTestCase):
+    # 1 марта 2021 - понедельник, 2 марта - вторник, 8 марта - понедельник.
+    MONDAY_FIRST = datetime(2021, 3, 1, 3, 0)
+    TUESDAY = datetime(2021, 3, 2, 3, 0)
+    MONDAY = datetime(2021, 3, 8, 3, 0)
+
+    def test_time(self):
+        self.assertTrue(matches('0 3 * * *', self.TUESDAY))
+        self.assertFalse(matches('0 4 * * *', self.TUESDAY))
+        self.assertFalse(matches('5 3 * * *', self.TUESDAY))
+        self.assertFalse(matches('0 3 * 4 *', self.TUESDAY))
+
+    def test_day_of_month_or_week(self):
+        expression = '0 3 1 * 1'
+        self.assertTrue(matches(expression, self.MONDAY_FIRST))
+        self.assertTrue(matches(expression, self.MONDAY))
+        self.assertTrue(matches(expression, datetime(2021, 4, 1, 3, 0)))
+        self.assertFalse(matches(expression, self.TUESDAY))
+
+    def test_single_day_restriction(self):
+        self.assertTrue(matches('0 3 * * 1', self.MONDAY))
+        self.assertFalse(matches('0 3 * * 1', self.TUESDAY))
+        self.assertTrue(matches('0 3 2 * *', self.TUESDAY))
+        self.assertFalse(matches('0 3 2 * *', self.MONDAY))
+        self.assertTrue(matches('0 3 */7 * 1', self.MONDAY))
+        self.assertFalse(matches('0 3 */7 * 1', self.TUESDAY))
+        self.assertTrue(matches('0 3 * * 0', datetime(2021, 3, 7, 3, 0)))
@@ -2,7 +2,7 @@ from django.contrib import admin
 
 from .models import (FavoriteRecipe, Ingredient,
                      IngredientAmount, Recipe,
-                     ShoppingList, Tag)
+                     ShoppingCartItem, ShoppingList, Tag)
 
 
 class IngredientInline(admin.TabularInline):
@@ -37,6 +37,12 @@ class ShoppingListAdmin(admin.ModelAdmin):
     search_fields = ('users',)
 
 
+class ShoppingCartItemAdmin(admin.ModelAdmin):
+    list_display = ('user', 'ingredient', 'amount')
+    list_filter = ('user',)
+    readonly_fields = ('user', 'ingredient', 'amount')
+
+
 class RecipeAdmin(admin.ModelAdmin):
     list_display = (
         'name',
@@ -61,10 +67,10 @@ class RecipeAdmin(admin.ModelAdmin):
         return None
 
     def count_favorites(self, obj):
-        queriset = obj.favorites.count()
-        if queriset:
-            return queriset
+        if obj.favorites_count:
+            return obj.favorites_count
         return None
+    count_favorites.admin_order_field = 'favorites_count'
 
     def get_ingredients(self, obj):
         ingredients_set = obj.list_ingredients()
@@ -79,3 +85,4 @@ admin.site.register(IngredientAmount, IngredientAmountAdmin)
 admin.site.register(FavoriteRecipe, FavoriteRecipeAdmin)
 admin.site.register(ShoppingList, ShoppingListAdmin)
 admin.site.register(Recipe, RecipeAdmin)
+admin.site.register(ShoppingCartItem, ShoppingCartItemAdmin)
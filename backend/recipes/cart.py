@@ -0,0 +1,132 @@
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+
+from django.db.models import Case, F, IntegerField, Q, Sum, Value, When
+
+from .models import IngredientAmount, ShoppingCartItem, ShoppingList
+
+BATCH_SIZE = 200
+
+
+def live_totals(user_ids=None):
+    """Суммы из связки ShoppingList - IngredientAmount, как раньше."""
+    amounts = IngredientAmount.objects.all()
+    if user_ids is not None:
+        amounts = amounts.filter(recipe__shopping_list__user__in=user_ids)
+    amounts = amounts.values(
+        'recipe__shopping_list__user', 'ingredients'
+    ).order_by().annotate(total=Sum('amount'))
+    return {
+        (row['recipe__shopping_list__user'], row['ingredients']): row['total']
+        for row in amounts
+        if row['recipe__shopping_list__user'] is not None
+    }
+
+
+def stored_totals(user_ids=None):
+    items = ShoppingCartItem.objects.all()
+    if user_ids is not None:
+        items = items.filter(user__in=user_ids)
+    return {
+        (user_id, ingredient_id): amount
+        for user_id, ingredient_id, amount in items.values_list(
+            'user_id', 'ingredient_id', 'amount')
+    }
+
+
+def change_cart(deltas):
+    """Атомарно меняет суммы: deltas - словарь {(user, ingredient): изменение}.
+
+    Недостающие строки для положительных изменений создаются с нулём
+    (отрицательное изменение несуществующей строки ничего не меняет,
+    а ингредиента или пользователя уже может не быть), затем одним
+    UPDATE прибавляется изменение, строки с нулевой суммой после
+    уменьшений удаляются.
+    """
+    keys = [key for key, delta in deltas.items() if delta]
+    for start in range(0, len(keys), BATCH_SIZE):
+        batch = keys[start:start + BATCH_SIZE]
+        ShoppingCartItem.objects.bulk_create(
+            [
+                ShoppingCartItem(user_id=user_id, ingredient_id=ingredient_id)
+                for user_id, ingredient_id in batch
+                if deltas[user_id, ingredient_id] > 0
+            ],
+            ignore_conflicts=True
+        )
+        condition = reduce(or_, (
+            Q(user_id=user_id, ingredient_id=ingredient_id)
+            for user_id, ingredient_id in batch
+        ))
+        items = ShoppingCartItem.objects.filter(condition)
+        items.update(amount=F('amount') + Case(
+            *[
+                When(user_id=user_id, ingredient_id=ingredient_id,
+                     then=Value(deltas[user_id, ingredient_id]))
+                for user_id, ingredient_id in batch
+            ],
+            default=Value(0),
+            output_field=IntegerField()
+        ))
+        if any(deltas[key] < 0 for key in batch):
+            items.filter(amount__lte=0).delete()
+
+
+def change_carts_for_recipes(pairs, sign=1):
+    """Рецепты добавлены в корзины (sign=1) или убраны (sign=-1).
+
+    pairs - пары (user_id, recipe_id).
+    """
+    users_by_recipe = defaultdict(list)
+    for user_id, recipe_id in pairs:
+        users_by_recipe[recipe_id].append(user_id)
+    if not users_by_recipe:
+        return
+    deltas = defaultdict(int)
+    amounts = IngredientAmount.objects.filter(
+        recipe_id__in=users_by_recipe
+    ).values_list('recipe_id', 'ingredients_id', 'amount')
+    for recipe_id, ingredient_id, amount in amounts:
+        for user_id in users_by_recipe[recipe_id]:
+            deltas[user_id, ingredient_id] += sign * amount
+    change_cart(deltas)
+
+
+def change_recipe_amounts(recipe_id, amount_deltas):
+    """Изменился состав рецепта: amount_deltas - {ingredient_id: изменение}."""
+    amount_deltas = {
+        ingredient_id: delta
+        for ingredient_id, delta in amount_deltas.items() if delta
+    }
+    if not amount_deltas:
+        return
+    user_ids = ShoppingList.objects.filter(
+        recipe_id=recipe_id).values_list('user_id', flat=True)
+    change_cart({
+        (user_id, ingredient_id): delta
+        for user_id in user_ids
+        for ingredient_id, delta in amount_deltas.items()
+    })
+
+
+def compare_carts(user_ids=None):
+    """Расхождения таблицы с живой суммой: (user, ingredient, было, надо)."""
+    stored = stored_totals(user_ids)
+    live = live_totals(user_ids)
+    for key in sorted(set(stored) | set(live)):
+        if stored.get(key, 0) != live.get(key, 0):
+            yield (*key, stored.get(key, 0), live.get(key, 0))
+
+
+def rebuild_carts(user_ids):
+    ShoppingCartItem.objects.filter(user__in=user_ids).delete()
+    ShoppingCartItem.objects.bulk_create(
+        [
+            ShoppingCartItem(
+                user_id=user_id, ingredient_id=ingredient_id, amount=total)
+            for (user_id, ingredient_id), total in live_totals(
+                user_ids).items()
+            if total > 0
+        ]
+    )
@@ -0,0 +1,221 @@
+import csv
+import gzip
+import hashlib
+import json
+from collections import Counter
+from itertools import islice
+
+from django.db import transaction
+
+from users.models import User
+from .counters import change_recipes_count
+from .models import CatalogImport, Ingredient, IngredientAmount, Recipe, Tag
+from .search import index_recipes
+from .versions import bump_version
+
+FIELDS = {
+    'ingredients': ('name', 'measurement_unit'),
+    'tags': ('name', 'slug', 'hexcolor'),
+    'recipes': (
+        'author', 'name', 'text', 'cooking_time', 'image', 'tags',
+        'ingredients'
+    ),
+}
+
+
+def get_format(path):
+    name = path[:-3] if path.endswith('.gz') else path
+    return 'jsonl' if name.endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def open_text(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, encoding='utf-8', newline='')
+
+
+def file_checksum(path, kind):
+    digest = hashlib.sha256(kind.encode())
+    with open(path, 'rb') as source:
+        for block in iter(lambda: source.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def is_imported(kind, checksum):
+    return CatalogImport.objects.filter(kind=kind, checksum=checksum).exists()
+
+
+def mark_imported(kind, checksum, rows):
+    CatalogImport.objects.update_or_create(
+        kind=kind, checksum=checksum, defaults={'rows': rows})
+
+
+def read_rows(path, kind, file_format):
+    """Читает файл построчно, не загружая его в память целиком.
+
+    В CSV у рецептов теги перечисляются через '|', а ингредиенты
+    записываются JSON-списком объектов name, measurement_unit, amount.
+    Строка заголовка, если она есть, пропускается.
+    """
+    fields = FIELDS[kind]
+    with open_text(path) as source:
+        if file_format == 'jsonl':
+            for line in source:
+                if line.strip():
+                    yield json.loads(line)
+            return
+        for row in csv.reader(source):
+            if not row or tuple(row[:len(fields)]) == fields:
+                continue
+            record = dict(zip(fields, row))
+            if kind == 'recipes':
+                record['tags'] = [
+                    slug for slug in record.get('tags', '').split('|') if slug
+                ]
+                record['ingredients'] = json.loads(
+                    record.get('ingredients') or '[]')
+            yield record
+
+
+def chunks(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def import_ingredients(chunk):
+    Ingredient.objects.bulk_create(
+        [
+            Ingredient(
+                name=row['name'].strip(),
+                measurement_unit=row['measurement_unit'].strip()
+            )
+            for row in chunk
+        ],
+        ignore_conflicts=True
+    )
+    return 0
+
+
+def import_tags(chunk):
+    Tag.objects.bulk_create(
+        [
+            Tag(
+                name=row['name'],
+                slug=row['slug'],
+                hexcolor=row.get('hexcolor') or '#ffffff'
+            )
+            for row in chunk
+        ],
+        ignore_conflicts=True
+    )
+    return 0
+
+
+def get_ingredient_ids(chunk):
+    """Находит id ингредиентов рецептов, недостающие создаёт."""
+    keys = {
+        (item['name'].strip(), item['measurement_unit'].strip())
+        for row in chunk for item in row['ingredients']
+    }
+    Ingredient.objects.bulk_create(
+        [Ingredient(name=name, measurement_unit=unit) for name, unit in keys],
+        ignore_conflicts=True
+    )
+    ingredients = Ingredient.objects.filter(
+        name__in={name for name, _ in keys}
+    ).values_list('name', 'measurement_unit', 'pk')
+    return {
+        (name, unit): pk for name, unit, pk in ingredients
+        if (name, unit) in keys
+    }
+
+
+def import_recipes(chunk):
+    """Рецепты, которые уже есть у автора под тем же названием, пропускаются.
+
+    bulk_create не вызывает сигналы, поэтому счётчики, поисковый индекс
+    и версии кэша обновляются здесь.
+    """
+    authors = dict(User.objects.filter(
+        username__in={str(row['author']) for row in chunk}
+    ).values_list('username', 'pk'))
+    tags = dict(Tag.objects.values_list('slug', 'pk'))
+    ingredients = get_ingredient_ids(chunk)
+    seen = set(Recipe.objects.filter(
+        author_id__in=authors.values(),
+        name__in={row['name'] for row in chunk}
+    ).values_list('author_id', 'name'))
+    skipped = 0
+    new = []
+    for row in chunk:
+        author_id = authors.get(str(row['author']))
+        if author_id is None or (author_id, row['name']) in seen:
+            skipped += 1
+            continue
+        seen.add((author_id, row['name']))
+        new.append((row, Recipe(
+            author_id=author_id,
+            name=row['name'],
+            text=row.get('text', ''),
+            cooking_time=int(row.get('cooking_time') or 1),
+            image=row.get('image') or ''
+        )))
+    if not new:
+        return skipped
+    Recipe.objects.bulk_create([recipe for _, recipe in new])
+    # SQLite не возвращает id из bulk_create, поэтому они перечитываются.
+    recipe_ids = {
+        (author_id, name): pk
+        for pk, author_id, name in Recipe.objects.filter(
+            author_id__in={recipe.author_id for _, recipe in new},
+            name__in={recipe.name for _, recipe in new}
+        ).values_list('pk', 'author_id', 'name')
+    }
+    amounts = []
+    links = []
+    for row, recipe in new:
+        recipe.pk = recipe_ids[recipe.author_id, recipe.name]
+        for item in row['ingredients']:
+            amounts.append(IngredientAmount(
+                recipe_id=recipe.pk,
+                ingredients_id=ingredients[
+                    item['name'].strip(), item['measurement_unit'].strip()],
+                amount=int(item['amount'])
+            ))
+        links.extend(
+            Recipe.tags.through(recipe_id=recipe.pk, tag_id=tags[slug])
+            for slug in row['tags'] if slug in tags
+        )
+    IngredientAmount.objects.bulk_create(amounts)
+    Recipe.tags.through.objects.bulk_create(links, ignore_conflicts=True)
+    authors_count = Counter(recipe.author_id for _, recipe in new)
+    change_recipes_count(authors_count)
+    index_recipes([recipe.pk for _, recipe in new])
+    bump_version(
+        'recipes', *(f'author:{author_id}' for author_id in authors_count))
+    return skipped
+
+
+IMPORTERS = {
+    'ingredients': (import_ingredients, ('ingredients',)),
+    'tags': (import_tags, ('tags',)),
+    'recipes': (import_recipes, ('ingredients', 'ingredient_usage')),
+}
+
+
+def import_catalog(path, kind, file_format=None, batch_size=1000):
+    """Загружает файл пачками, отдавая (обработано, пропущено)."""
+    importer, scopes = IMPORTERS[kind]
+    rows = read_rows(path, kind, file_format or get_format(path))
+    total = skipped = 0
+    for chunk in chunks(rows, batch_size):
+        with transaction.atomic():
+            skipped += importer(chunk)
+        total += len(chunk)
+        yield total, skipped
+    bump_version(*scopes)
@@ -0,0 +1,81 @@
+from collections import defaultdict
+
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from users.models import Follow, User
+from .models import FavoriteRecipe, Recipe
+
+
+COUNTER_FIELDS = ('favorites_count', 'recipes_count', 'followers_count')
+
+
+def save_without_counters(instance):
+    """save() существующего объекта без полей-счётчиков.
+
+    Счётчики меняет только change_counter через F(), а полный save()
+    записал бы поверх чужого инкремента значение, прочитанное раньше.
+    """
+    instance.save(update_fields=[
+        field.name for field in instance._meta.concrete_fields
+        if not field.primary_key and field.name not in COUNTER_FIELDS
+    ])
+
+
+def change_counter(model, field, deltas):
+    """Атомарно меняет счётчик: deltas - словарь {pk: изменение}."""
+    by_delta = defaultdict(list)
+    for pk, delta in deltas.items():
+        if delta:
+            by_delta[delta].append(pk)
+    for delta, pks in by_delta.items():
+        model.objects.filter(pk__in=pks).update(
+            **{field: F(field) + delta}
+        )
+
+
+def change_favorites_count(deltas):
+    change_counter(Recipe, 'favorites_count', deltas)
+
+
+def change_recipes_count(deltas):
+    change_counter(User, 'recipes_count', deltas)
+
+
+def change_followers_count(deltas):
+    change_counter(User, 'followers_count', deltas)
+
+
+def count_subquery(model, field):
+    counts = model.objects.filter(**{field: OuterRef('pk')}).order_by()
+    counts = counts.values(field).annotate(total=Count('pk')).values('total')
+    return Coalesce(Subquery(counts), 0)
+
+
+def recount_batches(model, batch_size, **counters):
+    last_pk = 0
+    while True:
+        pks = list(
+            model.objects.filter(pk__gt=last_pk).order_by('pk')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not pks:
+            return
+        model.objects.filter(pk__in=pks).update(**counters)
+        last_pk = pks[-1]
+        yield model, len(pks)
+
+
+def recount_all(batch_size=1000):
+    """Пересчитывает все счётчики пачками, отдавая прогресс."""
+    yield from recount_batches(
+        Recipe,
+        batch_size,
+        favorites_count=count_subquery(FavoriteRecipe, 'recipe')
+    )
+    yield from recount_batches(
+        User,
+        batch_size,
+        recipes_count=count_subquery(Recipe, 'author'),
+        followers_count=count_subquery(Follow, 'author')
+    )
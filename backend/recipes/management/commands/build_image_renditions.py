@@ -0,0 +1,80 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from recipes.models import Recipe
+from recipes.renditions import is_current, render_image, save_hashes
+
+
+def render(item):
+    """Выполняется в процессе пула: ошибки возвращаются, а не бросаются."""
+    pk, image_name, overwrite = item
+    try:
+        return pk, render_image(image_name, overwrite), None
+    except Exception as error:
+        return pk, None, repr(error)
+
+
+class Command(BaseCommand):
+    help = 'Строит уменьшенные копии картинок всех рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+        parser.add_argument('--start-after', type=int, default=0,
+                            help='Продолжить с рецепта с большим id')
+        parser.add_argument('--force', action='store_true',
+                            help='Пересоздать и актуальные копии')
+
+    def handle(self, *args, **options):
+        force = options['force']
+        last_pk = options['start_after']
+        done = skipped = 0
+        failures = []
+        started = time.monotonic()
+        # Процессы пула не работают с базой, соединения родителя
+        # не должны им достаться.
+        connections.close_all()
+        with ProcessPoolExecutor(
+            max_workers=options['workers'], initializer=django.setup
+        ) as pool:
+            while True:
+                batch = list(
+                    Recipe.objects.filter(pk__gt=last_pk).exclude(image='')
+                    .order_by('pk')
+                    .values_list('pk', 'image', 'image_hash')
+                    [:options['batch_size']]
+                )
+                if not batch:
+                    break
+                last_pk = batch[-1][0]
+                items = [
+                    (pk, image, force) for pk, image, image_hash in batch
+                    if force or not is_current(image, image_hash)
+                ]
+                skipped += len(batch) - len(items)
+                current = {pk: image_hash for pk, _, image_hash in batch}
+                hashes = {}
+                for pk, image_hash, error in pool.map(render, items):
+                    if error:
+                        failures.append((pk, error))
+                        continue
+                    done += 1
+                    if image_hash != current[pk]:
+                        hashes[pk] = image_hash
+                save_hashes(hashes)
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f'До id {last_pk}: готово {done}, актуальны {skipped}, '
+                    f'ошибок {len(failures)}, {done / elapsed:.1f} картинок/с'
+                )
+        for pk, error in failures:
+            self.stderr.write(f'Рецепт {pk}: {error}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово {done}, актуальны {skipped}, ошибок {len(failures)} '
+            f'за {time.monotonic() - started:.1f} с'
+        ))
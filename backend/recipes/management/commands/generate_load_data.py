@@ -0,0 +1,44 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.synthetic import generate
+
+
+class Command(BaseCommand):
+    help = (
+        'Создаёт синтетических пользователей, ингредиенты, теги, рецепты, '
+        'подписки, избранное и корзины для нагрузочных проверок'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--ingredients', type=int, default=500)
+        parser.add_argument('--tags', type=int, default=10)
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument('--ingredients-per-recipe', type=float,
+                            default=8, help='В среднем на рецепт')
+        parser.add_argument('--tags-per-recipe', type=float, default=2,
+                            help='В среднем на рецепт')
+        parser.add_argument('--follows', type=float, default=10,
+                            help='Подписок в среднем на пользователя')
+        parser.add_argument('--favorites', type=float, default=20,
+                            help='Рецептов в избранном в среднем')
+        parser.add_argument('--cart', type=float, default=5,
+                            help='Рецептов в корзине в среднем')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--seed', type=int,
+                            help='Для воспроизводимых данных')
+
+    def handle(self, *args, **options):
+        if options['recipes'] and not (
+            options['users'] and options['ingredients'] and options['tags']
+        ):
+            raise CommandError(
+                'Для рецептов нужны пользователи, ингредиенты и теги')
+        started = time.monotonic()
+        for name, count in generate(random.Random(options['seed']), options):
+            self.stdout.write(f'{name}: {count}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Данные созданы за {time.monotonic() - started:.1f} с'))
@@ -0,0 +1,43 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.catalog import (FIELDS, file_checksum, import_catalog,
+                             is_imported, mark_imported)
+
+
+class Command(BaseCommand):
+    help = 'Загружает ингредиенты, теги или рецепты из CSV или JSONL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--kind', choices=sorted(FIELDS),
+                            default='ingredients')
+        parser.add_argument('--format', choices=('csv', 'jsonl'),
+                            help='По умолчанию - по расширению файла')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--force', action='store_true',
+                            help='Загрузить, даже если файл не изменился')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        kind = options['kind']
+        if not os.path.isfile(path):
+            raise CommandError(f'Файл {path} не найден')
+        checksum = file_checksum(path, kind)
+        if not options['force'] and is_imported(kind, checksum):
+            self.stdout.write(self.style.SUCCESS(
+                'Файл уже загружен, изменений нет'))
+            return
+        total = skipped = 0
+        try:
+            for total, skipped in import_catalog(
+                path, kind, options['format'], options['batch_size']
+            ):
+                self.stdout.write(f'{kind}: {total}')
+        except (ValueError, KeyError) as error:
+            raise CommandError(
+                f'Ошибка в данных после строки {total}: {error!r}')
+        mark_imported(kind, checksum, total)
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено строк: {total}, пропущено: {skipped}'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from recipes.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает полнотекстовый индекс рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        total = 0
+        for count in rebuild_index(options['batch_size']):
+            total += count
+            self.stdout.write(f'Проиндексировано рецептов: {total}')
+        self.stdout.write(self.style.SUCCESS('Индекс перестроен'))
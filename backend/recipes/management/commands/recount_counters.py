@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from recipes.counters import recount_all
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики избранного, рецептов и подписчиков'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        totals = {}
+        for model, count in recount_all(options['batch_size']):
+            name = model._meta.verbose_name_plural
+            totals[name] = totals.get(name, 0) + count
+            self.stdout.write(f'{name}: {totals[name]}')
+        self.stdout.write(self.style.SUCCESS('Счётчики пересчитаны'))
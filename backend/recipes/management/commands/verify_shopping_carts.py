@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.cart import compare_carts, rebuild_carts
+
+
+class Command(BaseCommand):
+    help = 'Сверяет суммы в корзинах с живым подсчётом по рецептам'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true',
+                            help='Пересчитать корзины с расхождениями')
+
+    def handle(self, *args, **options):
+        users = set()
+        for user_id, ingredient_id, stored, live in compare_carts():
+            users.add(user_id)
+            self.stdout.write(
+                f'Пользователь {user_id}, ингредиент {ingredient_id}: '
+                f'{stored} вместо {live}'
+            )
+        if not users:
+            self.stdout.write(self.style.SUCCESS('Расхождений нет'))
+            return
+        if not options['fix']:
+            raise CommandError(
+                f'Расхождения в корзинах пользователей: {len(users)}')
+        rebuild_carts(users)
+        self.stdout.write(self.style.SUCCESS(
+            f'Корзины пересчитаны: {len(users)}'))
@@ -0,0 +1,44 @@
+from django.db import migrations
+
+# DDL записан здесь, а не берётся из recipes.search, чтобы изменения
+# модуля не меняли уже применённую миграцию.
+CREATE_SQL = {
+    'sqlite': [
+        'CREATE VIRTUAL TABLE IF NOT EXISTS recipes_recipe_fts '
+        'USING fts5(name, ingredients, text, '
+        "tokenize = 'unicode61 remove_diacritics 2')",
+    ],
+    'postgresql': [
+        'CREATE TABLE IF NOT EXISTS recipes_recipesearch ('
+        'recipe_id integer PRIMARY KEY '
+        'REFERENCES recipes_recipe (id) ON DELETE CASCADE, '
+        'document tsvector NOT NULL)',
+        'CREATE INDEX IF NOT EXISTS recipes_recipesearch_document '
+        'ON recipes_recipesearch USING GIN (document)',
+    ],
+}
+DROP_SQL = {
+    'sqlite': ['DROP TABLE IF EXISTS recipes_recipe_fts'],
+    'postgresql': ['DROP TABLE IF EXISTS recipes_recipesearch'],
+}
+
+
+def create_search_schema(apps, schema_editor):
+    for sql in CREATE_SQL.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def drop_search_schema(apps, schema_editor):
+    for sql in DROP_SQL.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_recipe_favorites_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_schema, drop_search_schema),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 2.2.19 on 2026-10-18 01:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_shoppingcartitem'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogImport',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=20, verbose_name='Что загружено')),
+                ('checksum', models.CharField(max_length=64, verbose_name='Контрольная сумма')),
+                ('rows', models.IntegerField(default=0, verbose_name='Строк')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Дата загрузки')),
+            ],
+            options={
+                'verbose_name': 'Загрузка каталога',
+                'verbose_name_plural': 'Загрузки каталога',
+                'ordering': ['-created'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='catalogimport',
+            constraint=models.UniqueConstraint(fields=('kind', 'checksum'), name='unique_catalog_import'),
+        ),
+    ]
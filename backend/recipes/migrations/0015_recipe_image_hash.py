@@ -0,0 +1,18 @@
+# Generated by Django 2.2.19 on 2026-10-18 01:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0014_catalogimport'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_hash',
+            field=models.CharField(blank=True, editable=False, help_text='По нему строятся пути к уменьшенным копиям картинки', max_length=40, verbose_name='Хэш картинки'),
+        ),
+    ]
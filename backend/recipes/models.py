@@ -62,6 +62,10 @@ class Recipe(models.Model):
         verbose_name='Дата публикации',
         auto_now_add=True
     )
+    updated_at = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True
+    )
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -94,6 +98,19 @@ class Recipe(models.Model):
             )
         ]
     )
+    favorites_count = models.IntegerField(
+        verbose_name='В избранном',
+        default=0,
+        editable=False,
+        db_index=True
+    )
+    image_hash = models.CharField(
+        verbose_name='Хэш картинки',
+        max_length=40,
+        blank=True,
+        editable=False,
+        help_text='По нему строятся пути к уменьшенным копиям картинки'
+    )
 
     class Meta:
         verbose_name = 'Рецепт'
@@ -204,3 +221,86 @@ class ShoppingList(models.Model):
 
     def __str__(self) -> str:
         return (f'{self.recipe.name}')
+
+
+class ShoppingCartItem(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+        related_name='shopping_cart_items'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент',
+        related_name='shopping_cart_items'
+    )
+    amount = models.IntegerField(
+        default=0,
+        verbose_name='Количество'
+    )
+
+    class Meta:
+        verbose_name = 'Ингредиент в корзине'
+        verbose_name_plural = 'Ингредиенты в корзине'
+        ordering = ['id', ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_cart_ingredient')
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.ingredient} - {self.amount}'
+
+
+class CatalogImport(models.Model):
+    kind = models.CharField(
+        max_length=20,
+        verbose_name='Что загружено'
+    )
+    checksum = models.CharField(
+        max_length=64,
+        verbose_name='Контрольная сумма'
+    )
+    rows = models.IntegerField(
+        default=0,
+        verbose_name='Строк'
+    )
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата загрузки'
+    )
+
+    class Meta:
+        verbose_name = 'Загрузка каталога'
+        verbose_name_plural = 'Загрузки каталога'
+        ordering = ['-created', ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['kind', 'checksum'],
+                name='unique_catalog_import')
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.kind} {self.checksum[:12]}'
+
+
+class DataVersion(models.Model):
+    scope = models.CharField(
+        max_length=200,
+        unique=True,
+        verbose_name='Область данных'
+    )
+    value = models.BigIntegerField(
+        verbose_name='Версия'
+    )
+
+    class Meta:
+        verbose_name = 'Версия данных'
+        verbose_name_plural = 'Версии данных'
+        ordering = ['scope', ]
+
+    def __str__(self) -> str:
+        return f'{self.scope}: {self.value}'
@@ -0,0 +1,108 @@
+from collections import defaultdict
+
+from django.db import connections, router
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from .models import Recipe
+
+SHORT_FIELDS = ('id', 'name', 'image', 'image_hash', 'cooking_time',
+                'author_id')
+
+
+def latest_recipes_by_author(author_ids, limit=None):
+    """Свежие рецепты сразу для всех авторов: {author_id: [рецепты]}.
+
+    С limit берутся первые limit рецептов каждого автора одним запросом
+    с ROW_NUMBER() OVER (PARTITION BY author_id); если СУБД не умеет
+    оконные функции, лишние рецепты отбрасываются в Python.
+    """
+    recipes = Recipe.objects.filter(author_id__in=author_ids).only(
+        *SHORT_FIELDS).order_by('author_id', '-pub_date', '-id')
+    connection = connections[recipes.db]
+    if limit is not None and connection.features.supports_over_clause:
+        ranked = recipes.annotate(row_number=Window(
+            RowNumber(),
+            partition_by=[F('author_id')],
+            order_by=[F('pub_date').desc(), F('id').desc()]
+        )).values_list(*SHORT_FIELDS, 'row_number')
+        sql, params = ranked.query.get_compiler(recipes.db).as_sql()
+        columns = ', '.join(SHORT_FIELDS)
+        recipes = Recipe.objects.db_manager(recipes.db).raw(
+            f'SELECT {columns} FROM ({sql}) ranked '
+            'WHERE row_number <= %s ORDER BY author_id, row_number',
+            params + (limit,)
+        )
+    grouped = defaultdict(list)
+    for recipe in recipes:
+        if limit is None or len(grouped[recipe.author_id]) < limit:
+            grouped[recipe.author_id].append(recipe)
+    return grouped
+
+
+def delete_without_signals(queryset):
+    """Один DELETE строк queryset без сигналов; число удалённых строк.
+
+    Для связей и составов рецептов, побочные эффекты удаления которых
+    вызывающий код применяет сам одним пакетом. Каскадов в Django
+    у этих моделей нет, поэтому Collector для них не нужен.
+    """
+    model = queryset.model
+    connection = connections[queryset.db]
+    quote = connection.ops.quote_name
+    sql, params = queryset.order_by().values('pk').query.get_compiler(
+        queryset.db).as_sql()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {quote(model._meta.db_table)} '
+            f'WHERE {quote(model._meta.pk.column)} IN ({sql})',
+            params
+        )
+        return cursor.rowcount
+
+
+def supports_insert_returning(connection):
+    return connection.vendor == 'postgresql' or (
+        connection.vendor == 'sqlite'
+        and connection.Database.sqlite_version_info >= (3, 35)
+    )
+
+
+def insert_ignore_conflicts(model, rows, returning, using=None):
+    """Вставляет строки, пропуская конфликты уникальности, без сигналов.
+
+    rows - словари {attname: значение}. Возвращает значения столбца
+    returning только у действительно вставленных строк: это решает
+    уникальное ограничение, а не предварительная проверка. С RETURNING
+    хватает одного INSERT, без него строки вставляются по одной
+    и вставленные определяются по rowcount.
+    """
+    if not rows:
+        return []
+    connection = connections[using or router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    columns = list(rows[0])
+    insert = (
+        f'{connection.ops.insert_statement(ignore_conflicts=True)} '
+        f'{quote(model._meta.db_table)} '
+        f'({", ".join(quote(column) for column in columns)}) VALUES '
+    )
+    values = '({})'.format(', '.join(['%s'] * len(columns)))
+    suffix = connection.ops.ignore_conflicts_suffix_sql(ignore_conflicts=True)
+    with connection.cursor() as cursor:
+        if supports_insert_returning(connection):
+            cursor.execute(
+                f'{insert}{", ".join([values] * len(rows))} {suffix} '
+                f'RETURNING {quote(returning)}',
+                [row[column] for row in rows for column in columns]
+            )
+            return [value for value, in cursor.fetchall()]
+        inserted = []
+        for row in rows:
+            cursor.execute(
+                f'{insert}{values} {suffix}',
+                [row[column] for column in columns]
+            )
+            if cursor.rowcount:
+                inserted.append(row[returning])
+        return inserted
@@ -0,0 +1,160 @@
+import hashlib
+import io
+import logging
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .models import Recipe
+from .versions import bump_version
+
+logger = logging.getLogger(__name__)
+
+RENDITIONS_DIR = 'recipes/renditions'
+# Карточка обрезается точно под размер, детальная картинка только
+# вписывается в него и не увеличивается.
+RENDITIONS = {
+    'card': ((480, 320), True),
+    'detail': ((1200, 800), False),
+}
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+EXTENSIONS = {'webp': 'webp', 'jpeg': 'jpg'}
+
+
+def get_path(image_hash, name, image_format):
+    return (
+        f'{RENDITIONS_DIR}/{image_hash[:2]}/{image_hash}/'
+        f'{name}.{EXTENSIONS[image_format]}'
+    )
+
+
+def get_paths(image_hash):
+    """Пути ко всем копиям: {'card': {'webp': ..., 'jpeg': ...}, ...}."""
+    return {
+        name: {
+            image_format: get_path(image_hash, name, image_format)
+            for image_format in FORMATS
+        }
+        for name in RENDITIONS
+    }
+
+
+def file_hash(file):
+    digest = hashlib.sha1()
+    file.seek(0)
+    for block in iter(lambda: file.read(1024 * 1024), b''):
+        digest.update(block)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def render(image, size, crop):
+    if crop:
+        return ImageOps.fit(image, size, Image.Resampling.LANCZOS)
+    image = image.copy()
+    image.thumbnail(size, Image.Resampling.LANCZOS)
+    return image
+
+
+def build_renditions(file, storage=default_storage, overwrite=False):
+    """Создаёт копии картинки, которых ещё нет в хранилище.
+
+    Пути зависят только от содержимого оригинала, поэтому готовые копии
+    не пересоздаются, а nginx может отдавать их с долгим кэшированием.
+    Возвращает хэш оригинала.
+    """
+    image_hash = file_hash(file)
+    paths = get_paths(image_hash)
+    missing = [
+        (name, image_format)
+        for name, formats in paths.items()
+        for image_format, path in formats.items()
+        if overwrite or not storage.exists(path)
+    ]
+    if not missing:
+        return image_hash
+    with Image.open(file) as original:
+        original = ImageOps.exif_transpose(original)
+        if original.mode not in ('RGB', 'RGBA'):
+            original = original.convert('RGBA')
+        for name, image_format in missing:
+            size, crop = RENDITIONS[name]
+            image = render(original, size, crop)
+            pil_format, options = FORMATS[image_format]
+            if pil_format == 'JPEG' and image.mode != 'RGB':
+                background = Image.new('RGB', image.size, 'white')
+                background.paste(image, mask=image.getchannel('A'))
+                image = background
+            buffer = io.BytesIO()
+            image.save(buffer, pil_format, **options)
+            path = paths[name][image_format]
+            if overwrite:
+                storage.delete(path)
+            storage.save(path, ContentFile(buffer.getvalue()))
+    return image_hash
+
+
+def is_current(image_name, image_hash, storage=default_storage):
+    """Копии есть и не старее оригинала: хэш заново не считается."""
+    if not image_hash:
+        return False
+    try:
+        modified = storage.get_modified_time(image_name)
+        return all(
+            storage.get_modified_time(path) >= modified
+            for formats in get_paths(image_hash).values()
+            for path in formats.values()
+        )
+    except (OSError, NotImplementedError):
+        return False
+
+
+def render_image(image_name, overwrite=False):
+    """Строит копии одного файла. Вызывается и в отдельных процессах."""
+    with default_storage.open(image_name, 'rb') as file:
+        return build_renditions(file, overwrite=overwrite)
+
+
+def save_hashes(hashes):
+    """Сохраняет новые хэши: hashes - словарь {recipe_id: хэш}."""
+    if not hashes:
+        return
+    recipes = list(Recipe.objects.filter(pk__in=hashes).only('author_id'))
+    for recipe in recipes:
+        recipe.image_hash = hashes[recipe.pk]
+        recipe.updated_at = timezone.now()
+    Recipe.objects.bulk_update(recipes, ['image_hash', 'updated_at'])
+    bump_version('recipes', *{
+        f'author:{recipe.author_id}' for recipe in recipes})
+
+
+def update_renditions(recipe_id):
+    """Строит копии картинки рецепта и запоминает хэш оригинала."""
+    recipe = Recipe.objects.filter(pk=recipe_id).only(
+        'image', 'image_hash', 'author_id').first()
+    if recipe is None or not recipe.image:
+        return None
+    try:
+        with recipe.image.open('rb') as file:
+            image_hash = build_renditions(file)
+    except (OSError, ValueError):
+        logger.exception('Не удалось уменьшить картинку рецепта %s', recipe_id)
+        return None
+    if image_hash != recipe.image_hash:
+        Recipe.objects.filter(pk=recipe_id).update(
+            image_hash=image_hash, updated_at=timezone.now())
+        bump_version('recipes', f'author:{recipe.author_id}')
+    return image_hash
+
+
+def remove_renditions(image_hash, storage=default_storage):
+    if not image_hash or Recipe.objects.filter(image_hash=image_hash).exists():
+        return
+    for formats in get_paths(image_hash).values():
+        for path in formats.values():
+            storage.delete(path)
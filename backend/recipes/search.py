@@ -0,0 +1,240 @@
+from django.db import connection
+from django.db.models import FloatField, Q
+from django.db.models.expressions import RawSQL
+
+from .models import IngredientAmount, Recipe
+from .stemmer import WORD_RE, stem, stem_text
+
+SQLITE_TABLE = 'recipes_recipe_fts'
+POSTGRES_TABLE = 'recipes_recipesearch'
+MAX_TERMS = 10
+
+
+def get_terms(query):
+    return [
+        term.lower() for term in WORD_RE.findall(query or '')
+    ][:MAX_TERMS]
+
+
+def load_documents(recipe_ids):
+    """Тексты рецептов для индекса: (id, название, ингредиенты, описание)."""
+    ingredients = {}
+    amounts = IngredientAmount.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list('recipe_id', 'ingredients__name')
+    for recipe_id, name in amounts:
+        ingredients.setdefault(recipe_id, []).append(name or '')
+    return [
+        (pk, name, ' '.join(ingredients.get(pk, [])), text)
+        for pk, name, text in Recipe.objects.filter(
+            pk__in=recipe_ids).values_list('pk', 'name', 'text')
+    ]
+
+
+class SqliteSearchBackend:
+    """FTS5-индекс. Русская морфология - через собственный стеммер.
+
+    В индекс пишутся основы слов, в запросе каждая основа ищется как
+    префикс, поэтому 'картошкой' находит 'картошка'.
+    """
+    weights = '10.0, 4.0, 1.0'
+
+    def index(self, recipe_ids):
+        recipe_ids = list(recipe_ids)
+        self.write(load_documents(recipe_ids), recipe_ids)
+
+    def write(self, documents, recipe_ids=None):
+        rows = [
+            (pk, stem_text(name), stem_text(ingredients), stem_text(text))
+            for pk, name, ingredients, text in documents
+        ]
+        with connection.cursor() as cursor:
+            self.delete_rows(
+                cursor,
+                [row[0] for row in rows] if recipe_ids is None else recipe_ids
+            )
+            cursor.executemany(
+                f'INSERT INTO {SQLITE_TABLE} '
+                '(rowid, name, ingredients, text) VALUES (%s, %s, %s, %s)',
+                rows
+            )
+
+    def delete_rows(self, cursor, recipe_ids):
+        cursor.executemany(
+            f'DELETE FROM {SQLITE_TABLE} WHERE rowid = %s',
+            [(pk,) for pk in recipe_ids]
+        )
+
+    def remove(self, recipe_ids):
+        with connection.cursor() as cursor:
+            self.delete_rows(cursor, recipe_ids)
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SQLITE_TABLE}')
+
+    def filter(self, queryset, query):
+        terms = [stem(term) for term in get_terms(query)]
+        if not terms:
+            return queryset
+        expression = ' '.join(f'"{term}"*' for term in terms)
+        table = queryset.model._meta.db_table
+        return queryset.extra(
+            where=[
+                f'"{table}"."id" IN (SELECT rowid FROM {SQLITE_TABLE} '
+                f'WHERE {SQLITE_TABLE} MATCH %s)'
+            ],
+            params=[expression]
+        ).annotate(search_rank=RawSQL(
+            f'SELECT -bm25({SQLITE_TABLE}, {self.weights}) '
+            f'FROM {SQLITE_TABLE} WHERE {SQLITE_TABLE} MATCH %s '
+            f'AND rowid = "{table}"."id"',
+            (expression,),
+            output_field=FloatField()
+        ))
+
+
+class PostgresSearchBackend:
+    """tsvector с конфигурацией russian и GIN-индекс."""
+    config = 'russian'
+
+    def index(self, recipe_ids):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {POSTGRES_TABLE} (recipe_id, document) '
+                'SELECT recipe.id, '
+                "setweight(to_tsvector(%s, recipe.name), 'A') || "
+                'setweight(to_tsvector(%s, '
+                "coalesce(string_agg(ingredient.name, ' '), '')), 'B') || "
+                "setweight(to_tsvector(%s, recipe.text), 'C') "
+                'FROM recipes_recipe recipe '
+                'LEFT JOIN recipes_ingredientamount amount '
+                'ON amount.recipe_id = recipe.id '
+                'LEFT JOIN recipes_ingredient ingredient '
+                'ON ingredient.id = amount.ingredients_id '
+                'WHERE recipe.id = ANY(%s) GROUP BY recipe.id '
+                'ON CONFLICT (recipe_id) '
+                'DO UPDATE SET document = EXCLUDED.document',
+                [self.config] * 3 + [list(recipe_ids)]
+            )
+
+    def write(self, documents):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {POSTGRES_TABLE} (recipe_id, document) '
+                "VALUES (%s, setweight(to_tsvector(%s, %s), 'A') || "
+                "setweight(to_tsvector(%s, %s), 'B') || "
+                "setweight(to_tsvector(%s, %s), 'C')) "
+                'ON CONFLICT (recipe_id) '
+                'DO UPDATE SET document = EXCLUDED.document',
+                [
+                    (pk, self.config, name, self.config, ingredients,
+                     self.config, text)
+                    for pk, name, ingredients, text in documents
+                ]
+            )
+
+    def remove(self, recipe_ids):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {POSTGRES_TABLE} WHERE recipe_id = ANY(%s)',
+                [list(recipe_ids)]
+            )
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'TRUNCATE {POSTGRES_TABLE}')
+
+    def filter(self, queryset, query):
+        terms = get_terms(query)
+        if not terms:
+            return queryset
+        expression = ' & '.join(f'{term}:*' for term in terms)
+        table = queryset.model._meta.db_table
+        return queryset.extra(
+            where=[
+                f'"{table}"."id" IN (SELECT recipe_id FROM {POSTGRES_TABLE} '
+                'WHERE document @@ to_tsquery(%s, %s))'
+            ],
+            params=[self.config, expression]
+        ).annotate(search_rank=RawSQL(
+            f'SELECT ts_rank(document, to_tsquery(%s, %s)) '
+            f'FROM {POSTGRES_TABLE} WHERE recipe_id = "{table}"."id"',
+            (self.config, expression),
+            output_field=FloatField()
+        ))
+
+
+class SimpleSearchBackend:
+    """Запасной вариант для СУБД без полнотекстового поиска."""
+
+    def index(self, recipe_ids):
+        pass
+
+    def write(self, documents):
+        pass
+
+    def remove(self, recipe_ids):
+        pass
+
+    def clear(self):
+        pass
+
+    def filter(self, queryset, query):
+        for term in get_terms(query):
+            queryset = queryset.filter(
+                Q(name__icontains=term)
+                | Q(text__icontains=term)
+                | Q(ingredients__name__icontains=term)
+            )
+        return queryset.distinct()
+
+
+BACKENDS = {
+    'sqlite': SqliteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_backend(vendor=None):
+    return BACKENDS.get(vendor or connection.vendor, SimpleSearchBackend)()
+
+
+def index_recipes(recipe_ids):
+    if recipe_ids:
+        get_backend().index(recipe_ids)
+
+
+def index_documents(documents):
+    """Индексирует уже известные тексты, не читая рецепты из базы.
+
+    documents - кортежи (id, название, ингредиенты через пробел,
+    описание), как у load_documents.
+    """
+    if documents:
+        get_backend().write(documents)
+
+
+def remove_recipes(recipe_ids):
+    if recipe_ids:
+        get_backend().remove(recipe_ids)
+
+
+def rebuild_index(batch_size=500):
+    backend = get_backend()
+    backend.clear()
+    last_pk = 0
+    while True:
+        pks = list(
+            Recipe.objects.filter(pk__gt=last_pk).order_by('pk')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not pks:
+            return
+        backend.index(pks)
+        last_pk = pks[-1]
+        yield len(pks)
+
+
+def search_recipes(queryset, query):
+    return get_backend().filter(queryset, query)
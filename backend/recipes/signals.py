@@ -0,0 +1,269 @@
+import threading
+import weakref
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_save)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from jobs.queue import enqueue
+from users.models import Follow, User
+from .cart import change_cart, change_carts_for_recipes
+from .counters import (change_favorites_count, change_followers_count,
+                       change_recipes_count)
+from .models import (FavoriteRecipe, Ingredient, IngredientAmount, Recipe,
+                     ShoppingList, Tag)
+from .search import index_recipes, remove_recipes
+from .versions import bump_version
+
+
+def touch_recipes(recipe_ids):
+    Recipe.objects.filter(pk__in=recipe_ids).update(
+        updated_at=timezone.now())
+
+
+class RecipeChanges:
+    """Изменения составов рецептов за одну транзакцию.
+
+    Сигналы IngredientAmount копят здесь изменения количеств по id
+    рецепта, а updated_at, версии кеша, поиск и корзины обновляются
+    после коммита одним пакетом, поэтому каскадное удаление рецепта
+    или ингредиента не стоит запросов на каждую строку. Корзины, в
+    которых лежит рецепт, запоминаются при первом его изменении, пока
+    каскад ещё не удалил связи.
+    """
+
+    def __init__(self, key=None):
+        self.key = key
+        self.deltas = {}
+        self.users = {}
+
+    def add(self, recipe_id, deltas):
+        if recipe_id not in self.deltas:
+            self.deltas[recipe_id] = defaultdict(int)
+            self.users[recipe_id] = list(ShoppingList.objects.filter(
+                recipe_id=recipe_id).values_list('user_id', flat=True))
+        for ingredient_id, delta in deltas.items():
+            self.deltas[recipe_id][ingredient_id] += delta
+
+    def __call__(self):
+        get_registry().pop(self.key, None)
+        recipe_ids = list(self.deltas)
+        touch_recipes(recipe_ids)
+        authors = set(Recipe.objects.filter(
+            pk__in=recipe_ids).values_list('author_id', flat=True))
+        bump_version(
+            'recipes', 'ingredient_usage',
+            *(f'author:{pk}' for pk in authors)
+        )
+        index_recipes(recipe_ids)
+        change_cart({
+            (user_id, ingredient_id): delta
+            for recipe_id, deltas in self.deltas.items()
+            for user_id in self.users[recipe_id]
+            for ingredient_id, delta in deltas.items()
+        })
+
+
+# Открытые пакеты потока по (базе, точкам сохранения). Ссылки слабые:
+# при откате транзакции или точки сохранения Django выбрасывает
+# колбэк, и пакет пропадает из реестра вместе с ним.
+pending = threading.local()
+
+
+def get_registry():
+    if not hasattr(pending, 'changes'):
+        pending.changes = weakref.WeakValueDictionary()
+    return pending.changes
+
+
+def change_recipe(using, recipe_id, deltas):
+    """Добавляет изменение в пакет транзакции, вне её применяет сразу.
+
+    Пакет свой у каждой точки сохранения, чтобы откат вложенного
+    atomic() не оставлял в пакете внешнего блока свои изменения.
+    """
+    connection = transaction.get_connection(using)
+    key = (connection.alias, tuple(connection.savepoint_ids))
+    registry = get_registry()
+    changes = registry.get(key)
+    if changes is not None:
+        changes.add(recipe_id, deltas)
+        return
+    changes = registry[key] = RecipeChanges(key)
+    changes.add(recipe_id, deltas)
+    transaction.on_commit(changes, using)
+
+
+def is_batched(instance):
+    """Версии и поиск рецепта обновит сам код, который его сохраняет."""
+    return getattr(instance, '_batch_side_effects', False)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    if not is_batched(instance):
+        bump_version('recipes', f'author:{instance.author_id}')
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, **kwargs):
+    if action.startswith('post_') and isinstance(instance, Recipe):
+        touch_recipes([instance.pk])
+        bump_version('recipes', f'author:{instance.author_id}')
+    elif action.startswith('post_'):
+        bump_version('tags')
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tag_changed(sender, **kwargs):
+    bump_version('tags')
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredient_changed(sender, **kwargs):
+    bump_version('ingredients')
+
+
+# Поля пользователя, которые видны в рецептах как автор.
+AUTHOR_FIELDS = {'email', 'username', 'first_name', 'last_name'}
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, created=False, update_fields=None,
+                 **kwargs):
+    if created or update_fields and not AUTHOR_FIELDS & set(update_fields):
+        return
+    bump_version(f'author:{instance.pk}')
+
+
+@receiver(post_save, sender=FavoriteRecipe)
+@receiver(post_delete, sender=FavoriteRecipe)
+@receiver(post_save, sender=ShoppingList)
+@receiver(post_delete, sender=ShoppingList)
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def user_relations_changed(sender, instance, **kwargs):
+    bump_version(f'user:{instance.user_id}')
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        change_recipes_count({instance.author_id: 1})
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    change_recipes_count({instance.author_id: -1})
+
+
+@receiver(post_save, sender=FavoriteRecipe)
+def favorite_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        change_favorites_count({instance.recipe_id: 1})
+
+
+@receiver(post_delete, sender=FavoriteRecipe)
+def favorite_deleted(sender, instance, **kwargs):
+    change_favorites_count({instance.recipe_id: -1})
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        change_followers_count({instance.author_id: 1})
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    change_followers_count({instance.author_id: -1})
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved_index(sender, instance, raw=False, **kwargs):
+    if not raw and not is_batched(instance):
+        index_recipes([instance.pk])
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted_index(sender, instance, **kwargs):
+    remove_recipes([instance.pk])
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_renamed_index(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        index_recipes(set(IngredientAmount.objects.filter(
+            ingredients=instance).values_list('recipe_id', flat=True)))
+
+
+@receiver(post_save, sender=ShoppingList)
+def shopping_list_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        change_carts_for_recipes([(instance.user_id, instance.recipe_id)])
+
+
+@receiver(post_delete, sender=ShoppingList)
+def shopping_list_deleted(sender, instance, **kwargs):
+    change_carts_for_recipes([(instance.user_id, instance.recipe_id)], -1)
+
+
+@receiver(pre_save, sender=IngredientAmount)
+def ingredient_amount_remember(sender, instance, raw=False, **kwargs):
+    instance._cart_previous = None
+    if instance.pk and not raw:
+        instance._cart_previous = IngredientAmount.objects.filter(
+            pk=instance.pk
+        ).values_list('recipe_id', 'ingredients_id', 'amount').first()
+
+
+@receiver(post_save, sender=IngredientAmount)
+def ingredient_amount_saved(sender, instance, raw=False, using=None,
+                            **kwargs):
+    if raw:
+        return
+    deltas = {instance.ingredients_id: instance.amount}
+    previous = getattr(instance, '_cart_previous', None)
+    if previous and previous[0] == instance.recipe_id:
+        deltas[previous[1]] = deltas.get(previous[1], 0) - previous[2]
+    elif previous:
+        change_recipe(using, previous[0], {previous[1]: -previous[2]})
+    change_recipe(using, instance.recipe_id, deltas)
+
+
+@receiver(post_delete, sender=IngredientAmount)
+def ingredient_amount_deleted(sender, instance, using=None, **kwargs):
+    change_recipe(
+        using, instance.recipe_id,
+        {instance.ingredients_id: -instance.amount}
+    )
+
+
+@receiver(pre_save, sender=Recipe)
+def recipe_remember_image(sender, instance, raw=False, **kwargs):
+    if raw or not instance.pk or hasattr(instance, '_image_previous'):
+        return
+    instance._image_previous = Recipe.objects.filter(
+        pk=instance.pk).values_list('image', flat=True).first()
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_image_renditions(sender, instance, raw=False, **kwargs):
+    previous = instance.__dict__.pop('_image_previous', None)
+    if raw or not instance.image:
+        return
+    if instance.image_hash and previous == instance.image.name:
+        return
+    enqueue('recipes.update_renditions', instance.pk)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted_renditions(sender, instance, **kwargs):
+    if instance.image_hash:
+        enqueue('recipes.remove_renditions', instance.image_hash)
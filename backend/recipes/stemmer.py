@@ -0,0 +1,123 @@
+import re
+
+VOWELS = 'аеиоуыэюя'
+WORD_RE = re.compile(r'\w+')
+
+
+def endings(*groups):
+    """Окончания с признаком 'должно предшествовать а/я'.
+
+    Отсортированы от длинных к коротким: как и в Snowball, выбирается
+    самое длинное совпадение.
+    """
+    items = []
+    for after_a, group in groups:
+        items.extend((ending, after_a) for ending in group)
+    return sorted(items, key=lambda item: len(item[0]), reverse=True)
+
+
+PERFECTIVE_GERUND = endings(
+    (True, ('в', 'вши', 'вшись')),
+    (False, ('ив', 'ивши', 'ившись', 'ыв', 'ывши', 'ывшись')),
+)
+ADJECTIVE = endings((False, (
+    'ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый', 'ой', 'ем',
+    'им', 'ым', 'ом', 'его', 'ого', 'ему', 'ому', 'их', 'ых', 'ую', 'юю',
+    'ая', 'яя', 'ою', 'ею'
+)))
+PARTICIPLE = endings(
+    (True, ('ем', 'нн', 'вш', 'ющ', 'щ')),
+    (False, ('ивш', 'ывш', 'ующ')),
+)
+REFLEXIVE = endings((False, ('ся', 'сь')))
+VERB = endings(
+    (True, (
+        'ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но',
+        'ет', 'ют', 'ны', 'ть', 'ешь', 'нно'
+    )),
+    (False, (
+        'ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей',
+        'уй', 'ил', 'ыл', 'им', 'ым', 'ен', 'ило', 'ыло', 'ено', 'ят',
+        'ует', 'уют', 'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю'
+    )),
+)
+NOUN = endings((False, (
+    'а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии',
+    'и', 'ией', 'ей', 'ой', 'ий', 'й', 'иям', 'ям', 'ием', 'ем', 'ам',
+    'ом', 'о', 'у', 'ах', 'иях', 'ях', 'ы', 'ь', 'ию', 'ью', 'ю', 'ия',
+    'ья', 'я'
+)))
+DERIVATIONAL = endings((False, ('ост', 'ость')))
+SUPERLATIVE = endings((False, ('ейш', 'ейше')))
+
+
+def regions(word):
+    rv = r1 = r2 = len(word)
+    for index, char in enumerate(word):
+        if char in VOWELS:
+            rv = index + 1
+            break
+    for index in range(1, len(word)):
+        if word[index] not in VOWELS and word[index - 1] in VOWELS:
+            r1 = index + 1
+            break
+    for index in range(r1 + 1, len(word)):
+        if word[index] not in VOWELS and word[index - 1] in VOWELS:
+            r2 = index + 1
+            break
+    return rv, r2
+
+
+def strip(word, start, suffixes):
+    """Удаляет самое длинное окончание, лежащее правее позиции start.
+
+    Возвращает None, если окончание не найдено или не выполнено
+    условие про предшествующую а/я.
+    """
+    for ending, after_a in suffixes:
+        if not word.endswith(ending):
+            continue
+        position = len(word) - len(ending)
+        if position < start:
+            continue
+        if after_a and (
+            position - 1 < start or word[position - 1] not in 'ая'
+        ):
+            return None
+        return word[:position]
+    return None
+
+
+def stem(word):
+    """Стеммер Портера для русского языка (алгоритм Snowball)."""
+    word = word.lower().replace('ё', 'е')
+    rv, r2 = regions(word)
+    if rv >= len(word):
+        return word
+    result = strip(word, rv, PERFECTIVE_GERUND)
+    if result is None:
+        word = strip(word, rv, REFLEXIVE) or word
+        result = strip(word, rv, ADJECTIVE)
+        if result is not None:
+            result = strip(result, rv, PARTICIPLE) or result
+        else:
+            result = strip(word, rv, VERB)
+            if result is None:
+                result = strip(word, rv, NOUN)
+    if result is not None:
+        word = result
+    if word.endswith('и') and len(word) - 1 >= rv:
+        word = word[:-1]
+    word = strip(word, r2, DERIVATIONAL) or word
+    result = strip(word, rv, SUPERLATIVE)
+    if result is not None:
+        word = result
+    if word.endswith('нн') and len(word) - 2 >= rv:
+        word = word[:-1]
+    elif word.endswith('ь') and len(word) - 1 >= rv:
+        return word[:-1]
+    return word
+
+
+def stem_text(text):
+    return ' '.join(stem(word) for word in WORD_RE.findall(text or ''))
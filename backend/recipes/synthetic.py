@@ -0,0 +1,228 @@
+import io
+from collections import Counter
+from itertools import accumulate
+from uuid import uuid4
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image
+
+from users.models import Follow, User
+from .cart import rebuild_carts
+from .counters import (change_favorites_count, change_followers_count,
+                       change_recipes_count)
+from .models import (FavoriteRecipe, Ingredient, IngredientAmount, Recipe,
+                     ShoppingList, Tag)
+from .search import index_recipes
+from .versions import bump_version
+
+IMAGE_NAME = 'recipes/images/synthetic.png'
+DISHES = (
+    'Борщ', 'Суп', 'Салат', 'Пирог', 'Каша', 'Котлеты', 'Паста', 'Омлет',
+    'Рагу', 'Плов', 'Запеканка', 'Блины'
+)
+WORDS = (
+    'картошка', 'морковь', 'лук', 'сыр', 'курица', 'говядина', 'грибы',
+    'томаты', 'чеснок', 'сметана', 'укроп', 'рис', 'гречка', 'яйцо'
+)
+UNITS = ('г', 'кг', 'мл', 'л', 'шт.', 'ст. л.', 'ч. л.', 'по вкусу')
+
+
+class Popularity:
+    """Выбор элементов по закону Ципфа: первые выпадают намного чаще."""
+
+    def __init__(self, rng, items):
+        self.rng = rng
+        self.items = items
+        self.weights = list(accumulate(
+            1 / (rank + 1) for rank in range(len(items))))
+
+    def choose(self, count):
+        """count элементов с повторами."""
+        return self.rng.choices(self.items, cum_weights=self.weights, k=count)
+
+    def sample(self, count, exclude=None):
+        """count разных элементов, кроме exclude."""
+        count = min(count, len(self.items) - (exclude is not None))
+        chosen = set()
+        while len(chosen) < count:
+            chosen.update(self.rng.choices(
+                self.items, cum_weights=self.weights, k=count - len(chosen)))
+            chosen.discard(exclude)
+        return chosen
+
+
+def fan_out(rng, average):
+    """Случайное число связей со средним average."""
+    return round(rng.expovariate(1 / average)) if average else 0
+
+
+def chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def get_image():
+    if not default_storage.exists(IMAGE_NAME):
+        buffer = io.BytesIO()
+        Image.new('RGB', (1200, 800), (230, 160, 90)).save(buffer, 'PNG')
+        default_storage.save(IMAGE_NAME, ContentFile(buffer.getvalue()))
+    return IMAGE_NAME
+
+
+def create_users(run, count):
+    password = make_password('synthetic')
+    User.objects.bulk_create(
+        [
+            User(
+                username=f'{run}-{number}',
+                email=f'{run}-{number}@example.com',
+                first_name='Тест',
+                last_name=f'Пользователь {number}',
+                password=password
+            )
+            for number in range(count)
+        ]
+    )
+    return list(User.objects.filter(
+        username__startswith=f'{run}-').values_list('pk', flat=True))
+
+
+def create_catalog(run, rng, ingredients, tags):
+    Ingredient.objects.bulk_create(
+        [
+            Ingredient(
+                name=f'{rng.choice(WORDS)} {run}-{number}',
+                measurement_unit=rng.choice(UNITS)
+            )
+            for number in range(ingredients)
+        ]
+    )
+    Tag.objects.bulk_create(
+        [
+            Tag(
+                name=f'Тег {run}-{number}',
+                slug=f'{run}-{number}',
+                hexcolor='#{:06x}'.format(rng.randrange(0x1000000))
+            )
+            for number in range(tags)
+        ]
+    )
+    return (
+        list(Ingredient.objects.filter(
+            name__contains=f' {run}-').values_list('pk', flat=True)),
+        list(Tag.objects.filter(
+            slug__startswith=f'{run}-').values_list('pk', flat=True))
+    )
+
+
+def create_recipes(run, rng, numbers, authors, ingredients, tags, options):
+    """Одна пачка рецептов с ингредиентами и тегами, возвращает их id."""
+    image = get_image()
+    new = [
+        Recipe(
+            author_id=author_id,
+            name=f'{rng.choice(DISHES)} {run}-{number}',
+            text=' '.join(rng.choices(WORDS, k=30)),
+            cooking_time=rng.randint(5, 180),
+            image=image
+        )
+        for number, author_id in zip(
+            numbers, authors.choose(len(numbers)))
+    ]
+    Recipe.objects.bulk_create(new)
+    # SQLite не возвращает id из bulk_create, поэтому они перечитываются.
+    recipe_ids = dict(Recipe.objects.filter(
+        name__in=[recipe.name for recipe in new]
+    ).values_list('name', 'pk'))
+    amounts = []
+    links = []
+    for recipe in new:
+        recipe.pk = recipe_ids[recipe.name]
+        amounts.extend(
+            IngredientAmount(
+                recipe_id=recipe.pk,
+                ingredients_id=ingredient_id,
+                amount=rng.randint(1, 500)
+            )
+            for ingredient_id in ingredients.sample(
+                max(1, fan_out(rng, options['ingredients_per_recipe'])))
+        )
+        links.extend(
+            Recipe.tags.through(recipe_id=recipe.pk, tag_id=tag_id)
+            for tag_id in tags.sample(
+                max(1, fan_out(rng, options['tags_per_recipe'])))
+        )
+    IngredientAmount.objects.bulk_create(amounts)
+    Recipe.tags.through.objects.bulk_create(links)
+    change_recipes_count(Counter(recipe.author_id for recipe in new))
+    index_recipes([recipe.pk for recipe in new])
+    return [recipe.pk for recipe in new]
+
+
+def create_relations(rng, user_ids, authors, recipes, options):
+    """Подписки, избранное и корзины пачки пользователей."""
+    follows = []
+    favorites = []
+    carts = []
+    for user_id in user_ids:
+        follows.extend(
+            Follow(user_id=user_id, author_id=author_id)
+            for author_id in authors.sample(
+                fan_out(rng, options['follows']), exclude=user_id)
+        )
+        favorites.extend(
+            FavoriteRecipe(user_id=user_id, recipe_id=recipe_id)
+            for recipe_id in recipes.sample(
+                fan_out(rng, options['favorites']))
+        )
+        carts.extend(
+            ShoppingList(user_id=user_id, recipe_id=recipe_id)
+            for recipe_id in recipes.sample(fan_out(rng, options['cart']))
+        )
+    Follow.objects.bulk_create(follows)
+    FavoriteRecipe.objects.bulk_create(favorites)
+    ShoppingList.objects.bulk_create(carts)
+    change_followers_count(Counter(follow.author_id for follow in follows))
+    change_favorites_count(
+        Counter(favorite.recipe_id for favorite in favorites))
+    rebuild_carts(user_ids)
+    return len(follows) + len(favorites) + len(carts)
+
+
+def generate(rng, options):
+    """Создаёт синтетические данные пачками, отдавая (что, сколько).
+
+    Все вставки идут через bulk_create, поэтому счётчики, корзины,
+    поисковый индекс и версии кэша обновляются явно, как при импорте.
+    """
+    # Метка запуска в именах не даёт повторному запуску с тем же seed
+    # упереться в уникальные поля.
+    run = uuid4().hex[:8]
+    batch_size = options['batch_size']
+    with transaction.atomic():
+        user_ids = create_users(run, options['users'])
+        ingredient_ids, tag_ids = create_catalog(
+            run, rng, options['ingredients'], options['tags'])
+    yield 'users', len(user_ids)
+    yield 'ingredients', len(ingredient_ids)
+    yield 'tags', len(tag_ids)
+    authors = Popularity(rng, user_ids)
+    ingredients = Popularity(rng, ingredient_ids)
+    tags = Popularity(rng, tag_ids)
+    recipe_ids = []
+    for numbers in chunks(range(options['recipes']), batch_size):
+        with transaction.atomic():
+            recipe_ids += create_recipes(
+                run, rng, numbers, authors, ingredients, tags, options)
+        yield 'recipes', len(recipe_ids)
+    recipes = Popularity(rng, recipe_ids)
+    relations = 0
+    for chunk in chunks(user_ids, max(1, batch_size // 10)):
+        with transaction.atomic():
+            relations += create_relations(
+                rng, chunk, authors, recipes, options)
+        yield 'relations', relations
+    bump_version('recipes', 'tags', 'ingredients')
@@ -0,0 +1,20 @@
+from jobs.queue import task
+from .cart import compare_carts, rebuild_carts
+from .counters import recount_all
+from .renditions import remove_renditions, update_renditions
+
+task('recipes.update_renditions')(update_renditions)
+task('recipes.remove_renditions')(remove_renditions)
+
+
+@task('recipes.recount_counters', max_attempts=3)
+def recount_counters():
+    for _ in recount_all():
+        pass
+
+
+@task('recipes.fix_shopping_carts', max_attempts=3)
+def fix_shopping_carts():
+    users = {user_id for user_id, *_ in compare_carts()}
+    if users:
+        rebuild_carts(users)
@@ -0,0 +1,42 @@
+import time
+
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+
+from .models import DataVersion
+
+
+def get_versions(*scopes):
+    """Текущие версии данных для областей (recipes, tags, author:<id>...).
+
+    Версии хранятся в базе, поэтому изменение, сделанное любым процессом
+    (воркером gunicorn, фоновой задачей, командой), сразу видят все
+    остальные. Версия - метка времени в миллисекундах.
+    """
+    versions = dict(DataVersion.objects.filter(
+        scope__in=scopes).values_list('scope', 'value'))
+    missing = [scope for scope in scopes if scope not in versions]
+    if missing:
+        now = int(time.time() * 1000)
+        DataVersion.objects.bulk_create(
+            [DataVersion(scope=scope, value=now) for scope in missing],
+            ignore_conflicts=True
+        )
+        versions.update(DataVersion.objects.filter(
+            scope__in=missing).values_list('scope', 'value'))
+    return [versions[scope] for scope in scopes]
+
+
+def get_version(scope):
+    return get_versions(scope)[0]
+
+
+def bump_version(*scopes):
+    now = int(time.time() * 1000)
+    updated = DataVersion.objects.filter(scope__in=scopes).update(
+        value=Greatest(F('value') + 1, Value(now)))
+    if updated < len(set(scopes)):
+        DataVersion.objects.bulk_create(
+            [DataVersion(scope=scope, value=now) for scope in set(scopes)],
+            ignore_conflicts=True
+        )
@@ -1,5 +1,8 @@
 python manage.py makemigrations
 python manage.py migrate
 python manage.py loaddata fixtures.json
+python manage.py recount_counters
+python manage.py rebuild_search_index
+python manage.py verify_shopping_carts --fix
 python manage.py collectstatic --noinput
 gunicorn foodgram.wsgi:application --bind 0:8000
\ No newline at end of file
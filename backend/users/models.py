@@ -42,6 +42,16 @@ class User(AbstractUser):
         choices=ROLES,
         default='user'
     )
+    recipes_count = models.IntegerField(
+        verbose_name='Количество рецептов',
+        default=0,
+        editable=False
+    )
+    followers_count = models.IntegerField(
+        verbose_name='Количество подписчиков',
+        default=0,
+        editable=False
+    )
 
     class Meta:
         verbose_name = 'Пользователь'